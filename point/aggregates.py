@@ -0,0 +1,280 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import db
+import instrument
+import schema
+from local_store import local_store
+
+logger = instrument.get_logger('aggregates')
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+WEEKDAYS_FR = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi']
+
+
+def prepare_frame(df):
+    # afficher les noms des colonnes et quelques lignes pour vérification
+    logger.debug("Column names: %s", df.columns)
+    logger.debug("Sample data:\n%s", df.head())
+
+    # s'assurer que la colonne 'date' est au format datetime
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'], errors='coerce')
+        df['month'] = df['date'].dt.month
+
+    # fonction pour obtenir le jour de la semaine à partir d'un objet datetime
+        def get_day_of_week(date_obj):
+            return date_obj.strftime("%A") if pd.notna(date_obj) else None
+
+        # appliquer la fonction à la colonne 'date' et créer une nouvelle colonne 'Jour_de_la_Semaine'
+        df['Jour_de_la_Semaine'] = df['date'].apply(get_day_of_week)
+
+        # convertir 'travail' en format numérique pour l'affichage
+        df['travail'] = pd.to_timedelta(df['travail']).dt.total_seconds() / 3600  # convertir en heures
+    else:
+        logger.warning("Column 'date' does not exist in the DataFrame.")
+    return df
+
+
+def read_dbbi():
+    # table brute complète, depuis PostgreSQL ou le fichier local selon [storage]
+    if db.backend() == 'sqlite':
+        return local_store.read_frame()
+    return db.read_frame('SELECT * FROM dbbi')
+
+
+def normalize_filter(selected_months, selected_names):
+    # (mois AAAA-MM, noms) triés et sans doublons ; None signifie « pas de filtre »
+    months = tuple(sorted(set(selected_months))) if selected_months else None
+    names = None if "Tous les noms" in selected_names else tuple(sorted(set(selected_names)))
+    return months, names
+
+
+class FilterIndex:
+    # positions des lignes par (employé, mois AAAA-MM), calculées une fois par chargement ;
+    # un filtre ne fait plus que rassembler les blocs sélectionnés au lieu de parcourir toute la table
+    def __init__(self, df):
+        self.size = len(df)
+        names = df['nom'].str.strip()
+        periods = df['date'].dt.to_period('M')
+        # dropna=False : les lignes sans nom ou sans date restent sélectionnables par l'autre critère
+        groups = pd.Series(range(len(df)), index=df.index).groupby([names, periods], dropna=False, sort=False)
+        self.blocks = {(name, None if pd.isna(period) else str(period)): positions
+                       for (name, period), positions in groups.indices.items()}
+        # mois présents dans les données, pour la liste de filtres
+        self.months = sorted({month for _, month in self.blocks if month is not None})
+
+    def positions(self, months=None, names=None):
+        # months : mois AAAA-MM ; names : noms sans espaces ; None = pas de filtre
+        months = set(months) if months is not None else None
+        names = set(names) if names is not None else None
+        selected = [positions for (name, month), positions in self.blocks.items()
+                    if (names is None or name in names) and (months is None or month in months)]
+        if not selected:
+            return np.empty(0, dtype='int64')
+        # ordre d'origine des lignes, pour des agrégats identiques à un filtre par masque
+        return np.sort(np.concatenate(selected))
+
+    def select(self, df, months=None, names=None):
+        if months is None and names is None:
+            return df
+        return df.iloc[self.positions(months, names)]
+
+
+class PanelCache:
+    # cache LRU des données de graphiques, indexé par (mode, mois, noms) normalisés
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_or_compute(self, key, compute):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        # calcul hors du verrou : une requête lente ne bloque pas les autres filtres
+        panels = compute()
+        self.put(key, panels)
+        return panels
+
+    def lookup(self, key):
+        # (trouvé, valeur) ; None est une valeur valide (filtre sans données)
+        with self.lock:
+            if key not in self.entries:
+                return False, None
+            self.entries.move_to_end(key)
+            return True, self.entries[key]
+
+    def put(self, key, panels):
+        with self.lock:
+            self.entries[key] = panels
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, months, names):
+        # supprimer les entrées dont le filtre peut contenir un des mois ou un des noms modifiés
+        months, names = set(months), {name.strip() for name in names}
+        with self.lock:
+            for key in list(self.entries):
+                _, key_months, key_names = key
+                if ((key_months is None or months.intersection(key_months))
+                        and (key_names is None or names.intersection(key_names))):
+                    del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+panel_cache = PanelCache(int(db.settings('dashboard').get('cache_size', 32)))
+
+
+def invalidate_rows(dates, names):
+    # appelée après une insertion dans dbbi avec les dates et les noms des lignes écrites
+    months = pd.to_datetime(pd.Series(dates), errors='coerce').dropna().dt.to_period('M').astype(str).unique()
+    panel_cache.invalidate(months, [name for name in names if isinstance(name, str)])
+
+
+def compute_panels(df):
+    # données des six graphiques à partir des lignes filtrées en mémoire
+    if df.empty:
+        return None
+    with instrument.span('aggregate', rows=len(df)):
+        # moyenne du travail par jour de la semaine, du lundi au vendredi
+        weekday_df = df[df['Jour_de_la_Semaine'].isin(WEEKDAYS)]
+        weekday = weekday_df.groupby('Jour_de_la_Semaine')['travail'].mean().reindex(WEEKDAYS, fill_value=0)
+        weekday.index = WEEKDAYS_FR
+
+        daily = df.groupby('date')['travail'].mean()
+        monthly = df.groupby(df['date'].dt.to_period('M')).agg({'travail': 'mean'})
+        monthly.index = monthly.index.to_timestamp()
+
+        return {
+            'weekday': weekday,
+            'daily': fill_daily(daily),
+            'monthly': monthly,
+            'employee_totals': df.groupby('nom')['travail'].sum(),
+            'mean': df['travail'].mean(),
+            'start': df['date'].min(),
+            'end': df['date'].max(),
+        }
+
+
+def fill_daily(daily):
+    # une valeur par jour calendaire, 0 pour les jours sans travail
+    if daily.empty:
+        return pd.DataFrame({'date': pd.DatetimeIndex([]), 'travail': pd.Series(dtype='float64')})
+    daily.index = pd.to_datetime(daily.index)
+    all_dates = pd.date_range(start=daily.index.min(), end=daily.index.max(), name='date')
+    return daily.reindex(all_dates).fillna(0).rename('travail').reset_index()
+
+
+# filtres appliqués aux tables d'agrégats ; les mois sont passés par leur premier jour (AAAA-MM-01),
+# un mars 2024 ne mélange donc pas les mars des autres années ; les paramètres NULL désactivent le filtre
+ROLLUP_FILTER = """
+    (%(months)s::date[] IS NULL OR {month} = ANY(%(months)s::date[]))
+    AND (%(names)s::text[] IS NULL OR nom = ANY(%(names)s::text[]))
+"""
+MONTHLY_FILTER = ROLLUP_FILTER.format(month='mois')
+DAILY_FILTER = ROLLUP_FILTER.format(month="date_trunc('month', date)::date")
+
+# lues dans {table}_monthly (employé × mois × jour de semaine) sauf la série journalière ({table}_daily) :
+# le coût dépend du nombre d'employés et de mois, pas du nombre de lignes brutes
+PANEL_QUERIES = {
+    'summary': f"""
+        SELECT SUM(lignes), SUM(travail) / NULLIF(SUM(jours_travail), 0), MIN(premiere_date), MAX(derniere_date)
+        FROM {{table}}_monthly WHERE {MONTHLY_FILTER}
+    """,
+    'weekday': f"""
+        SELECT jour_semaine, SUM(travail) / NULLIF(SUM(jours_travail), 0)
+        FROM {{table}}_monthly
+        WHERE jour_semaine BETWEEN 1 AND 5 AND {MONTHLY_FILTER}
+        GROUP BY jour_semaine
+    """,
+    'daily': f"""
+        SELECT date, SUM(travail) / NULLIF(SUM(jours_travail), 0)
+        FROM {{table}}_daily WHERE {DAILY_FILTER}
+        GROUP BY date ORDER BY date
+    """,
+    'monthly': f"""
+        SELECT mois, SUM(travail) / NULLIF(SUM(jours_travail), 0)
+        FROM {{table}}_monthly WHERE {MONTHLY_FILTER}
+        GROUP BY mois ORDER BY mois
+    """,
+    'employee_totals': f"SELECT nom, SUM(travail) FROM {{table}}_monthly WHERE {MONTHLY_FILTER} GROUP BY nom ORDER BY nom",
+}
+
+
+def query_panels(months=None, names=None, table='dbbi'):
+    # mêmes données que compute_panels, agrégées par la base : seuls les résultats groupés transitent ;
+    # avec le stockage local, SQLite les calcule dans le processus à partir de la table brute
+    with instrument.span('query', panels=len(PANEL_QUERIES), backend=db.backend()):
+        if db.backend() == 'sqlite':
+            results = local_store.panel_rows(months, names, table)
+        else:
+            results = query_panel_rows(months, names, table)
+
+    count, mean, start, end = results['summary'][0]
+    if not count:
+        return None
+
+    weekday = pd.Series(0.0, index=range(1, 6))
+    for day, value in results['weekday']:
+        weekday[day] = value if value is not None else 0.0
+    weekday.index = WEEKDAYS_FR
+
+    daily = pd.Series({pd.Timestamp(date): value for date, value in results['daily']}, dtype='float64')
+    monthly = pd.DataFrame({'travail': [value for _, value in results['monthly']]},
+                           index=pd.DatetimeIndex([month for month, _ in results['monthly']]), dtype='float64')
+
+    return {
+        'weekday': weekday,
+        'daily': fill_daily(daily),
+        'monthly': monthly,
+        'employee_totals': pd.Series({nom: value for nom, value in results['employee_totals']}, dtype='float64'),
+        'mean': mean if mean is not None else float('nan'),
+        'start': pd.Timestamp(start),
+        'end': pd.Timestamp(end),
+    }
+
+
+def query_panel_rows(months=None, names=None, table='dbbi'):
+    params = {'months': [f"{month}-01" for month in months] if months is not None else None,
+              'names': list(names) if names is not None else None}
+    results = {}
+    with db.connection() as conn:
+        schema.ensure_rollups(conn, table)
+        with conn.cursor() as cursor:
+            for panel, query in PANEL_QUERIES.items():
+                cursor.execute(query.format(table=table), params)
+                results[panel] = cursor.fetchall()
+    return results
+
+
+def cached_query_panels(months=None, names=None):
+    return panel_cache.get_or_compute(('sql', months, names), lambda: query_panels(months, names))
+
+
+def query_names():
+    if db.backend() == 'sqlite':
+        return local_store.names()
+    with db.connection() as conn:
+        schema.ensure_rollups(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT nom FROM dbbi_monthly")
+            return [row[0] for row in cursor.fetchall()]
+
+
+def query_months():
+    if db.backend() == 'sqlite':
+        return local_store.months()
+    with db.connection() as conn:
+        schema.ensure_rollups(conn)
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT to_char(mois, 'YYYY-MM') FROM dbbi_monthly ORDER BY 1")
+            return [row[0] for row in cursor.fetchall()]
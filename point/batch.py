@@ -0,0 +1,243 @@
+import argparse
+import contextlib
+import glob
+import os
+import pickle
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import db
+import instrument
+from exrtact import ExcelFileHandler
+
+EXTENSIONS = ('.xls', '.xlsx')
+
+
+def expand_inputs(inputs):
+    # répertoires (fichiers Excel qu'ils contiennent), motifs glob ou fichiers, sans doublons et dans l'ordre
+    files = []
+    seen = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = [os.path.join(item, name) for name in sorted(os.listdir(item))
+                       if name.lower().endswith(EXTENSIONS)]
+        else:
+            # un fichier inexistant est gardé pour être signalé en erreur
+            matches = [path for path in sorted(glob.glob(item)) if not os.path.isdir(path)] or [item]
+        for path in matches:
+            if os.path.abspath(path) not in seen:
+                seen.add(os.path.abspath(path))
+                files.append(path)
+    return files
+
+
+def output_path(file_path, output_dir):
+    return os.path.join(output_dir, os.path.splitext(os.path.basename(file_path))[0] + '.xlsx')
+
+
+def process_file(file_path, per_employee=False, output_dir=None, spill_path=None):
+    # exécutée dans un processus du pool : lecture et traitement, puis écriture du .xlsx corrigé et, pour
+    # l'insertion, des lots dans spill_path ; les erreurs sont renvoyées dans le résultat pour ne pas
+    # interrompre les autres fichiers
+    result = {'file': file_path, 'rows': 0, 'load_seconds': None, 'save_seconds': None, 'error': None,
+              'spill': None}
+    handler = ExcelFileHandler()
+    start = time.perf_counter()
+    try:
+        df = handler.load_excel_batches(file_path, per_employee=per_employee)
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+        return result
+    result['load_seconds'] = time.perf_counter() - start
+    result['rows'] = len(df)
+
+    if output_dir is not None:
+        start = time.perf_counter()
+        if not handler.save_excel(df, output_path(file_path, output_dir)):
+            result['error'] = f"unable to save {output_path(file_path, output_dir)}"
+        result['save_seconds'] = time.perf_counter() - start
+    if spill_path is not None and result['error'] is None:
+        try:
+            spill_frame(df, spill_path)
+        except Exception as e:
+            result['error'] = f"unable to spill rows to {spill_path}: {e}"
+        else:
+            result['spill'] = spill_path
+    return result
+
+
+def spill_frame(df, path, batch_size=10000):
+    # lots du tableau traité écrits l'un après l'autre, relus un par un par le processus principal
+    with open(path, 'wb') as f:
+        for start in range(0, len(df), batch_size):
+            pickle.dump(df.iloc[start:start + batch_size], f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def spilled_batches(path):
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def insert_files(results, delta=False, report=print):
+    # une seule insertion groupée alimentée fichier par fichier et lot par lot depuis les lots écrits par les
+    # processus du pool : le processus principal ne relit aucun classeur et ne garde qu'un lot en mémoire ;
+    # un fichier illisible à cette étape est signalé et les suivants sont insérés
+    handler = ExcelFileHandler()
+
+    def batches():
+        for result in results:
+            try:
+                yield from spilled_batches(result['spill'])
+            except Exception as e:
+                result['error'] = f"{type(e).__name__}: {e}"
+                report(format_result(result))
+
+    with instrument.span('insert', files=len(results)):
+        return handler.insert_to_db(batches(), bulk=True, delta=delta)
+
+
+def init_worker(settings):
+    instrument.configure(settings)
+
+
+def run_batch(files, per_employee=False, output_dir=None, insert=False, delta=False, workers=None, report=print):
+    # traiter les fichiers en parallèle puis insérer leurs lignes, lot par lot, en une seule insertion groupée
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    results = []
+    start = time.perf_counter()
+    # lots à insérer, un fichier par entrée, écrits par les processus du pool et supprimés après l'insertion
+    with (tempfile.TemporaryDirectory(prefix='point-batch-') if insert else contextlib.nullcontext()) as spill_dir:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files)) or 1, initializer=init_worker,
+                                 initargs=(db.settings('logging'),)) as pool:
+            futures = [pool.submit(process_file, file_path, per_employee, output_dir,
+                                   os.path.join(spill_dir, f"{i}.pickle") if insert else None)
+                       for i, file_path in enumerate(files)]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                report(format_result(result))
+        elapsed = time.perf_counter() - start
+
+        # ordre des fichiers en entrée, quel que soit l'ordre de fin des processus
+        order = {file_path: i for i, file_path in enumerate(files)}
+        results.sort(key=lambda result: order[result['file']])
+        rows = sum(result['rows'] for result in results if result['error'] is None)
+        summary = {'files': len(files), 'failed': sum(result['error'] is not None for result in results),
+                   'rows': rows, 'workers': workers, 'seconds': elapsed, 'counts': None, 'insert_failed': False}
+
+        loaded = [result for result in results if result['error'] is None]
+        if insert and loaded:
+            counts = insert_files(loaded, delta, report)
+            summary['failed'] = sum(result['error'] is not None for result in results)
+            summary['counts'] = counts
+            summary['insert_failed'] = counts is None
+            summary['seconds'] = time.perf_counter() - start
+    # les fichiers de lots n'existent plus
+    for result in results:
+        result.pop('spill')
+    report(format_summary(summary))
+    return results, summary
+
+
+def file_state(file_path):
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch(inputs, interval=30, polls=None, report=print, **options):
+    # scruter les entrées toutes les `interval` secondes ; un fichier nouveau ou modifié est importé en mode
+    # delta dès que sa taille et sa date sont identiques sur deux passages (copie terminée)
+    imported = {}
+    observed = {}
+    poll = 0
+    while polls is None or poll < polls:
+        ready = []
+        for file_path in expand_inputs(inputs):
+            try:
+                state = file_state(file_path)
+            except OSError:
+                continue
+            if imported.get(file_path) == state:
+                continue
+            if observed.get(file_path) == state:
+                ready.append(file_path)
+            else:
+                observed[file_path] = state
+        if ready:
+            # un fichier en erreur n'est retenté qu'après une nouvelle modification
+            run_batch(ready, report=report, **{**options, 'insert': True, 'delta': True})
+            for file_path in ready:
+                imported[file_path] = observed.pop(file_path)
+        poll += 1
+        if polls is None or poll < polls:
+            time.sleep(interval)
+
+
+def format_result(result):
+    if result['error'] is not None:
+        return f"ERREUR {result['file']}: {result['error']}"
+    line = f"OK     {result['file']}: {result['rows']} lignes, lecture {result['load_seconds']:.3f} s"
+    if result['save_seconds'] is not None:
+        line += f", écriture {result['save_seconds']:.3f} s"
+    return line
+
+
+def format_summary(summary):
+    rate = summary['rows'] / summary['seconds'] if summary['seconds'] else 0
+    line = (f"{summary['files']} fichiers ({summary['failed']} en erreur), {summary['rows']} lignes "
+            f"en {summary['seconds']:.2f} s avec {summary['workers']} processus ({rate:.0f} lignes/s)")
+    counts = summary['counts']
+    if counts is not None:
+        line += (f" ; base : {counts['inserted']} insérées, {counts['skipped']} ignorées, "
+                 f"{counts['failed']} en erreur")
+    elif summary['insert_failed']:
+        line += " ; échec de l'insertion dans la base de données"
+    return line
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import sans interface d'exports de pointage (.xls/.xlsx)")
+    parser.add_argument('inputs', nargs='+', help="fichiers, répertoires ou motifs glob (ex. 'exports/*.xls')")
+    parser.add_argument('--insert', action='store_true', help="insérer toutes les lignes dans la base en une fois")
+    parser.add_argument('--output-dir', help="écrire un .xlsx corrigé par fichier dans ce répertoire")
+    parser.add_argument('--workers', type=int, default=None, help="nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument('--per-employee', action='store_true', help="cumul du travail par employé")
+    parser.add_argument('--delta', action='store_true',
+                        help="n'insérer que les journées postérieures à la dernière date en base de chaque employé")
+    parser.add_argument('--watch', action='store_true',
+                        help="surveiller les entrées et importer (en mode delta) les fichiers nouveaux ou modifiés")
+    parser.add_argument('--interval', type=float, default=float(db.settings('sync').get('watch_interval', 30)),
+                        help="intervalle de scrutation de --watch, en secondes")
+    args = parser.parse_args(argv)
+
+    instrument.configure(db.settings('logging'))
+    options = {'per_employee': args.per_employee, 'output_dir': args.output_dir, 'workers': args.workers}
+    if args.watch:
+        try:
+            watch(args.inputs, args.interval, **options)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    files = expand_inputs(args.inputs)
+    if not files:
+        parser.error("aucun fichier .xls ou .xlsx trouvé")
+    if not args.insert and args.output_dir is None:
+        parser.error("indiquer --insert et/ou --output-dir")
+
+    results, summary = run_batch(files, insert=args.insert, delta=args.delta, **options)
+    # code de sortie 1 si un fichier ou l'insertion a échoué
+    if summary['failed'] or summary['insert_failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
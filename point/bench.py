@@ -0,0 +1,483 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import aggregates
+import db
+import instrument
+import schema
+from exrtact import ExcelFileHandler, EXTRACTED_COLUMNS
+from local_store import local_store
+from parse_cache import parse_cache
+
+
+def synthetic_frame(employees, days, absence_rate=0.05, seed=0):
+    # générer un DataFrame extrait (mêmes colonnes et mêmes types que load_excel) pour N employés × D jours
+    rng = np.random.default_rng(seed)
+    noms = np.repeat([f"Employe {i:04d}" for i in range(employees)], days)
+    dates = np.tile(pd.date_range('2024-01-01', periods=days).to_numpy(dtype='datetime64[s]'), employees)
+    entree = rng.integers(7 * 3600, 10 * 3600, size=len(noms))
+    travail = rng.integers(6 * 3600, 10 * 3600, size=len(noms))
+    absent = rng.random(len(noms)) < absence_rate
+    travail[absent] = 0
+
+    def absences(values):
+        # NaT pour les absences
+        return pd.Series(values).where(~absent)
+
+    df = pd.DataFrame({
+        'Nom': pd.Categorical(noms),
+        'Date': absences(dates),
+        'Entrée': absences(entree.astype('timedelta64[s]')),
+        'Sortie': absences((entree + travail).astype('timedelta64[s]')),
+        'Travail': absences(travail.astype('timedelta64[s]')),
+        'Travail Cumulée': np.cumsum(travail).astype('timedelta64[s]'),
+        'Commentaire': '',
+    })
+    return df[EXTRACTED_COLUMNS]
+
+
+def synthetic_export(employees, days, absence_rate=0.05, seed=0):
+    # export brut de pointeuse (colonnes Nom., Date., Entrée., Sortie.), une ligne par employé et par jour
+    rng = np.random.default_rng(seed)
+    rows = employees * days
+    noms = np.tile([f"Employe {i:04d}" for i in range(employees)], days)
+    dates = np.repeat(pd.date_range('2024-01-01', periods=days).strftime('%d/%m/%Y').to_numpy(dtype=object), employees)
+    entree = rng.integers(7 * 3600, 10 * 3600, size=rows)
+    sortie = entree + rng.integers(6 * 3600, 10 * 3600, size=rows)
+    # une partie des pointages est au format hh:mm, comme dans les exports réels
+    short = rng.random(rows) < 0.5
+    absent = rng.random(rows) < absence_rate
+
+    def clock(seconds):
+        hours, rest = np.divmod(seconds, 3600)
+        minutes, secs = np.divmod(rest, 60)
+        return np.array([f"{h:02}:{m:02}" if s else f"{h:02}:{m:02}:{x:02}"
+                         for h, m, x, s in zip(hours.tolist(), minutes.tolist(), secs.tolist(), short.tolist())],
+                        dtype=object)
+
+    return pd.DataFrame({
+        'Nom.': noms,
+        'Date.': dates,
+        'Entrée.': np.where(absent, None, clock(entree)),
+        'Sortie.': np.where(absent, None, clock(sortie)),
+    })
+
+
+def write_export(df, file_path):
+    # .xlsx avec openpyxl ; .xls avec xlwt (pandas ne sait plus écrire ce format), limité à 65536 lignes
+    if file_path.endswith('.xlsx'):
+        df.to_excel(file_path, index=False, engine='openpyxl')
+        return
+    import xlwt
+    if len(df) >= 65536:
+        raise ValueError(f"{len(df)} rows do not fit in an .xls sheet")
+    book = xlwt.Workbook()
+    sheet = book.add_sheet('Pointage')
+    for col, name in enumerate(df.columns):
+        sheet.write(0, col, name)
+    for row, values in enumerate(df.itertuples(index=False), start=1):
+        for col, value in enumerate(values):
+            if value is not None:
+                sheet.write(row, col, value)
+    book.save(file_path)
+
+
+def timed(fn, *args, **kwargs):
+    # mesurer un appel sans le coût des print vers le terminal
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return elapsed, result
+
+
+def measure(fn, repeat, setup=None):
+    # durées de `repeat` appels ; setup prépare chaque appel hors chronométrage
+    seconds = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        seconds.append(timed(fn)[0])
+    return seconds
+
+
+@contextlib.contextmanager
+def scratch_table(table='dbbi_bench'):
+    # table jetable avec la même structure que dbbi, supprimée avec ses agrégats à la sortie
+    db.execute(f"DROP TABLE IF EXISTS {table}; CREATE TABLE {table} (LIKE dbbi INCLUDING DEFAULTS)")
+    try:
+        yield table
+    finally:
+        reset_scratch_table(table)
+        db.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def reset_scratch_table(table='dbbi_bench'):
+    db.execute(f"TRUNCATE {table}; DROP INDEX IF EXISTS {table}_nom_date_key")
+    with db.connection() as conn:
+        schema.drop_rollups(conn, table)
+
+
+def bench_insert(args):
+    df = synthetic_frame(args.employees, args.days, args.absence_rate)
+    handler = ExcelFileHandler()
+
+    results = []
+    with scratch_table() as handler.table:
+        for mode, kwargs in (('per-row', {}), ('bulk', {'bulk': True, 'batch_size': args.batch_size})):
+            reset_scratch_table(handler.table)
+            # premier passage : tout est inséré ; second passage : tout est un doublon
+            for phase in ('fresh', 'reinsert'):
+                elapsed, counts = timed(handler.insert_to_db, df, **kwargs)
+                results.append({
+                    'benchmark': 'insert_to_db',
+                    'mode': mode,
+                    'phase': phase,
+                    'rows': len(df),
+                    'seconds': round(elapsed, 4),
+                    'rows_per_second': round(len(df) / elapsed, 1) if elapsed else None,
+                    'counts': counts,
+                })
+    return results
+
+
+def storage_result(backend, operation, seconds, rows, **fields):
+    return {**suite_result(operation, seconds, rows, **fields), 'benchmark': 'storage', 'backend': backend}
+
+
+def bench_storage(args):
+    # mêmes lignes dans PostgreSQL (table jetable) et dans un fichier SQLite temporaire : insertion groupée,
+    # lecture de la table complète (mode mémoire du tableau de bord) et agrégats des graphiques (mode sql)
+    df = synthetic_frame(args.employees, args.days, args.absence_rate, args.seed)
+    month = df['Date'].dropna().dt.to_period('M').astype(str).min()
+    handler = ExcelFileHandler()
+    handler.table = 'dbbi_bench'
+    results = []
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # fichier SQLite propre à cette exécution
+        saved_path, local_store.path = local_store.path, os.path.join(workdir, 'bench.sqlite3')
+        try:
+            def reset_local():
+                with local_store.connection(handler.table) as conn:
+                    conn.execute(f"DELETE FROM {handler.table}")
+
+            seconds = measure(lambda: handler.insert_local([df], batch_size=args.batch_size), args.repeat,
+                              setup=reset_local)
+            results.append(storage_result('sqlite', 'insert', seconds, len(df)))
+            seconds = measure(lambda: local_store.read_frame(handler.table), args.repeat)
+            results.append(storage_result('sqlite', 'read_table', seconds, len(df)))
+            for months in (None, (month,)):
+                seconds = measure(lambda: local_store.panel_rows(months, None, handler.table), args.repeat)
+                results.append(storage_result('sqlite', 'query_panels', seconds, len(df),
+                                              months=list(months) if months else None))
+        finally:
+            local_store.path = saved_path
+
+    if args.skip_db:
+        results.append({'benchmark': 'storage', 'backend': 'postgresql', 'skipped': '--skip-db'})
+        return results
+    try:
+        with scratch_table() as handler.table:
+            seconds = measure(lambda: handler.insert_postgresql([df], bulk=True, batch_size=args.batch_size),
+                              args.repeat, setup=lambda: reset_scratch_table(handler.table))
+            results.append(storage_result('postgresql', 'insert', seconds, len(df)))
+            seconds = measure(lambda: db.read_frame(f"SELECT * FROM {handler.table}"), args.repeat)
+            results.append(storage_result('postgresql', 'read_table', seconds, len(df)))
+            for months in (None, (month,)):
+                seconds = measure(lambda: aggregates.query_panel_rows(months, None, handler.table), args.repeat)
+                results.append(storage_result('postgresql', 'query_panels', seconds, len(df),
+                                              months=list(months) if months else None))
+    except Exception as e:
+        results.append({'benchmark': 'storage', 'backend': 'postgresql', 'skipped': str(e)})
+    finally:
+        handler.table = ExcelFileHandler.table
+    return results
+
+
+def dashboard_frame(df):
+    # lignes extraites mises sous la forme de dbbi, puis préparées comme les lit le tableau de bord
+    from dashboard import Dashboard
+    rows, _ = ExcelFileHandler().rows_for_db(df)
+    frame = pd.DataFrame(rows, columns=['nom', 'date', 'travail', 'travail_cumule'])
+    return Dashboard.prepare_frame(frame)
+
+
+def suite_result(operation, seconds, rows, **fields):
+    return {
+        'benchmark': 'suite',
+        'operation': operation,
+        **fields,
+        'rows': rows,
+        'repeat': len(seconds),
+        'min_seconds': round(min(seconds), 4),
+        'median_seconds': round(statistics.median(seconds), 4),
+        'rows_per_second': round(rows / min(seconds), 1) if min(seconds) else None,
+    }
+
+
+def bench_suite_size(employees, days, args, workdir, app):
+    results = []
+    size = {'employees': employees, 'days': days}
+    raw = synthetic_export(employees, days, args.absence_rate, args.seed)
+    handler = ExcelFileHandler()
+
+    extracted = None
+    for extension in ('xlsx', 'xls'):
+        file_path = os.path.join(workdir, f"pointage_{employees}x{days}.{extension}")
+        try:
+            write_export(raw, file_path)
+        except ValueError as e:
+            results.append({'benchmark': 'suite', 'operation': 'load_excel', 'format': extension, **size,
+                            'skipped': str(e)})
+            continue
+        # à froid : le cache vidé avant chaque lecture ; à chaud : relu depuis le cache disque
+        seconds = measure(lambda: handler.load_excel(file_path), args.repeat, setup=parse_cache.clear)
+        results.append(suite_result('load_excel', seconds, len(raw), format=extension, cache='cold', **size))
+        extracted = handler.df
+        if parse_cache.enabled:
+            seconds = measure(lambda: handler.load_excel(file_path), args.repeat)
+            results.append(suite_result('load_excel', seconds, len(raw), format=extension, cache='warm', **size))
+
+    output_path = os.path.join(workdir, 'sortie.xlsx')
+    seconds = measure(lambda: handler.save_excel(extracted, output_path), args.repeat)
+    results.append(suite_result('save_excel', seconds, len(extracted), **size))
+
+    if args.skip_db:
+        results.append({'benchmark': 'suite', 'operation': 'insert_to_db', **size, 'skipped': '--skip-db'})
+    else:
+        try:
+            with scratch_table() as handler.table:
+                seconds = measure(lambda: handler.insert_to_db(extracted, bulk=True), args.repeat,
+                                  setup=lambda: reset_scratch_table(handler.table))
+            results.append(suite_result('insert_to_db', seconds, len(extracted), mode='bulk', **size))
+        except Exception as e:
+            results.append({'benchmark': 'suite', 'operation': 'insert_to_db', **size, 'skipped': str(e)})
+        finally:
+            handler.table = ExcelFileHandler.table
+
+    # cumul recalculé après des modifications de 'Travail' réparties sur toute la feuille
+    from exrtact import PandasModel
+    model = None
+
+    def edit_model():
+        nonlocal model
+        model = PandasModel(extracted.copy())
+        for row in np.linspace(0, len(extracted) - 1, 100, dtype=int):
+            model.set_travail_seconds(int(row), 8 * 3600)
+
+    seconds = measure(lambda: model.update_cumulative_travail(0), args.repeat, setup=edit_model)
+    results.append(suite_result('update_cumulative_travail', seconds, len(extracted), edits=100, **size))
+
+    # collage d'une colonne de 'Travail' sur les lignes chargées : une modification groupée, un recalcul
+    pasted = '\n'.join(['08:00'] * min(len(extracted), PandasModel.fetch_size))
+    seconds = measure(lambda: model.paste(pasted, 0, model.travail_col), args.repeat,
+                      setup=edit_model)
+    results.append(suite_result('paste', seconds, len(extracted), cells=pasted.count('\n') + 1, **size))
+
+    from dashboard import Dashboard
+    from PyQt5.QtCore import QThreadPool
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        frame = dashboard_frame(extracted)
+        dashboard = Dashboard()
+        # le chargement lancé par le constructeur est attendu puis remplacé par les données synthétiques
+        QThreadPool.globalInstance().waitForDone()
+        app.processEvents()
+        dashboard.query_mode = 'memory'
+        dashboard.set_data(frame)
+    dashboard.month_listwidget.item(1).setSelected(True)
+    for row in range(1, min(6, dashboard.name_listwidget.count())):
+        dashboard.name_listwidget.item(row).setSelected(True)
+
+    def reset_dashboard():
+        aggregates.panel_cache.clear()
+        dashboard.renderer.inputs.clear()
+
+    seconds = measure(dashboard.apply_filter, args.repeat, setup=reset_dashboard)
+    results.append(suite_result('apply_filter', seconds, len(frame), cache='cold', **size))
+    seconds = measure(dashboard.apply_filter, args.repeat)
+    results.append(suite_result('apply_filter', seconds, len(frame), cache='warm', **size))
+
+    def select_all():
+        reset_dashboard()
+        dashboard.filtered_df = dashboard.df
+        dashboard.filter_key = ('memory', None, None)
+
+    seconds = measure(dashboard.plot_data, args.repeat, setup=select_all)
+    results.append(suite_result('plot_data', seconds, len(frame), **size))
+
+    # zoom sur les 30 derniers jours puis retour à la vue complète : la série journalière est re-réduite
+    ax = dashboard.renderer.axes['daily']
+    full_view = ax.get_xlim()
+
+    def zoom_daily():
+        ax.set_xlim(full_view[1] - 30, full_view[1])
+        ax.set_xlim(*full_view)
+
+    seconds = measure(zoom_daily, args.repeat)
+    results.append(suite_result('zoom_daily', seconds, len(dashboard.renderer.daily_x), **size))
+    dashboard.close()
+    return results
+
+
+def run_metadata(args):
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        revision = None
+    import matplotlib
+    return {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'sizes': args.size,
+        'absence_rate': args.absence_rate,
+        'seed': args.seed,
+        'repeat': args.repeat,
+    }
+
+
+def bench_suite(args):
+    # tableau de bord sans affichage : Qt hors écran, rendu Agg du canevas matplotlib
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    os.environ.setdefault('MPLBACKEND', 'Agg')
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        # cache des fichiers traités propre à cette exécution
+        parse_cache.directory = os.path.join(workdir, 'parse_cache')
+        for size in args.size:
+            employees, days = (int(value) for value in size.lower().split('x'))
+            results.extend(bench_suite_size(employees, days, args, workdir, app))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output:
+            json.dump({'meta': run_metadata(args), 'results': results, 'instrument': instrument.snapshot()},
+                      output, indent=2, ensure_ascii=False)
+    return results
+
+
+# exécuté dans un processus neuf : les temps d'import ne dépendent pas des modules déjà chargés
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+import exrtact
+imported = time.perf_counter()
+window = exrtact.MainWindow()
+window.show()
+app.processEvents()
+shown = time.perf_counter()
+heavy = [name for name in ('matplotlib', 'seaborn', 'mplcursors', 'openpyxl') if name in sys.modules]
+from dashboard import Dashboard
+dashboard_imported = time.perf_counter()
+dashboard = Dashboard()
+dashboard.show()
+app.processEvents()
+dashboard_shown = time.perf_counter()
+print(json.dumps({
+    'import_exrtact': imported - start,
+    'main_window': shown - start,
+    'import_dashboard': dashboard_imported - shown,
+    'dashboard_window': dashboard_shown - shown,
+    'heavy_modules_at_startup': heavy,
+}))
+sys.stdout.flush()
+os._exit(0)
+"""
+
+
+def bench_startup(args):
+    # démarrage à froid : import d'exrtact, fenêtre principale visible, puis ouverture du tableau de bord
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get('QT_QPA_PLATFORM', 'offscreen'))
+    runs = []
+    for _ in range(args.repeat):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+
+    results = []
+    for step in ('import_exrtact', 'main_window', 'import_dashboard', 'dashboard_window'):
+        seconds = statistics.median(run[step] for run in runs)
+        result = {'benchmark': 'startup', 'step': step, 'runs': len(runs), 'median_seconds': round(seconds, 4)}
+        if step == 'main_window' and args.budget is not None:
+            result['budget_seconds'] = args.budget
+            result['over_budget'] = seconds > args.budget
+        results.append(result)
+    # la fenêtre principale ne doit charger ni matplotlib ni openpyxl
+    heavy = sorted(set().union(*(run['heavy_modules_at_startup'] for run in runs)))
+    results.append({'benchmark': 'startup', 'step': 'heavy_modules_at_startup', 'modules': heavy,
+                    'over_budget': bool(heavy)})
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de l'outil de pointage")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    insert_parser = subparsers.add_parser('insert', help="comparer l'insertion ligne par ligne et l'insertion groupée")
+    insert_parser.add_argument('--employees', type=int, default=200)
+    insert_parser.add_argument('--days', type=int, default=30)
+    insert_parser.add_argument('--absence-rate', type=float, default=0.05)
+    insert_parser.add_argument('--batch-size', type=int, default=1000)
+    insert_parser.set_defaults(func=bench_insert)
+
+    suite_parser = subparsers.add_parser('suite', help="chronométrer chargement, sauvegarde, insertion, cumul et tableau de bord")
+    suite_parser.add_argument('--size', action='append', default=None,
+                              help="EMPLOYESxJOURS, répétable (défaut : 50x30 et 200x90)")
+    suite_parser.add_argument('--absence-rate', type=float, default=0.05)
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--skip-db', action='store_true', help="ne pas chronométrer insert_to_db")
+    suite_parser.add_argument('--output', help="fichier JSON (métadonnées et résultats) à comparer entre versions")
+    suite_parser.set_defaults(func=bench_suite)
+
+    storage_parser = subparsers.add_parser('storage', help="comparer les stockages PostgreSQL et SQLite local")
+    storage_parser.add_argument('--employees', type=int, default=200)
+    storage_parser.add_argument('--days', type=int, default=90)
+    storage_parser.add_argument('--absence-rate', type=float, default=0.05)
+    storage_parser.add_argument('--seed', type=int, default=0)
+    storage_parser.add_argument('--batch-size', type=int, default=1000)
+    storage_parser.add_argument('--repeat', type=int, default=3)
+    storage_parser.add_argument('--skip-db', action='store_true', help="ne pas mesurer PostgreSQL")
+    storage_parser.set_defaults(func=bench_storage)
+
+    startup_parser = subparsers.add_parser('startup', help="mesurer le démarrage à froid de l'application")
+    startup_parser.add_argument('--repeat', type=int, default=5)
+    startup_parser.add_argument('--budget', type=float, default=None,
+                                help="durée maximale (s) jusqu'à la fenêtre principale ; code de sortie 1 si dépassée")
+    startup_parser.set_defaults(func=bench_startup)
+
+    args = parser.parse_args(argv)
+    if args.command == 'suite' and not args.size:
+        args.size = ['50x30', '200x90']
+    results = args.func(args)
+    for result in results:
+        print(json.dumps(result))
+    # un dépassement de budget fait échouer la commande, pour repérer les régressions
+    if any(result.get('over_budget') for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
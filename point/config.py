@@ -15,8 +15,9 @@ def config(filename="db.ini", section="postgresql"):
 
     return db
 
-try:
-    db_params = config()
-    print("Database configuration parameters:", db_params)
-except Exception as e:
-    print(e)
+if __name__ == "__main__":
+    try:
+        db_params = config()
+        print("Database configuration parameters:", db_params)
+    except Exception as e:
+        print(e)
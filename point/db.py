@@ -0,0 +1,118 @@
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+import pandas as pd
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import config
+
+# db.ini est lu à côté de ce module, quel que soit le répertoire courant
+DB_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db.ini')
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def _read_section(section):
+    return config(DB_INI, section)
+
+
+def settings(section):
+    # sections facultatives de db.ini, lues une seule fois ; une section absente donne {}
+    try:
+        return dict(_read_section(section))
+    except Exception:
+        return {}
+
+
+def flag(section, key, default=False):
+    # option booléenne d'une section de db.ini (true/false, yes/no, on/off, 1/0)
+    value = settings(section).get(key)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+BACKENDS = ('postgresql', 'sqlite')
+
+
+def backend():
+    # moteur de stockage de [storage] : 'postgresql' (serveur, par défaut) ou 'sqlite' (fichier local, sans serveur)
+    name = settings('storage').get('backend', '').strip().lower() or 'postgresql'
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown storage backend {name!r} in {DB_INI}, expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+def connection_params():
+    return dict(_read_section("postgresql"))
+
+
+def get_pool():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            pool_settings = settings("pool")
+            minconn = int(pool_settings.get('minconn', 1))
+            maxconn = int(pool_settings.get('maxconn', 5))
+            _pool = ThreadedConnectionPool(minconn, maxconn, **connection_params())
+            # ThreadedConnectionPool lève une erreur quand il est épuisé : on attend plutôt une connexion libre
+            _slots = threading.BoundedSemaphore(maxconn)
+        return _pool
+
+
+@contextmanager
+def connection():
+    pool = get_pool()
+    _slots.acquire()
+    try:
+        conn = pool.getconn()
+    except Exception:
+        _slots.release()
+        raise
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        # une connexion cassée est fermée par le pool au lieu d'être réutilisée
+        pool.putconn(conn, close=bool(conn.closed))
+        _slots.release()
+
+
+def execute(query, params=None):
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            rowcount = cursor.rowcount
+        conn.commit()
+    return rowcount
+
+
+def fetch_all(query, params=None):
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+
+
+def read_frame(query, params=None):
+    with connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            columns = [column.name for column in cursor.description]
+            return pd.DataFrame(cursor.fetchall(), columns=columns)
+
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
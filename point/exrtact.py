@@ -1,34 +1,171 @@
 import subprocess
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QFileDialog, QPushButton, QVBoxLayout, 
-                             QHBoxLayout, QWidget, QTableView, QMessageBox, QSizePolicy, QDialog)
-from PyQt5.QtCore import QAbstractTableModel, Qt
-from PyQt5.QtGui import QColor
+                             QHBoxLayout, QWidget, QTableView, QMessageBox, QSizePolicy, QDialog, QProgressBar,
+                             QShortcut)
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from PyQt5.QtGui import QColor, QKeySequence
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
 import psycopg2
-from config import config
+from psycopg2.extras import execute_values
+import aggregates
+import db
+import instrument
+import schema
+from local_store import local_store
+from parse_cache import parse_cache
+import sqlite3
 import sys
 import os
-from dashboard import Dashboard
+from workers import start_worker
+
+logger = instrument.get_logger('exrtact')
+
+class FenwickTree:
+    # arbre de Fenwick (sommes préfixes) : mise à jour et cumul en O(log n)
+    def __init__(self, values):
+        values = np.asarray(values, dtype='int64')
+        self.size = len(values)
+        prefix = np.concatenate(([0], np.cumsum(values)))
+        index = np.arange(1, self.size + 1)
+        # construction vectorisée : tree[i] = somme des valeurs de ]i - lowbit(i), i]
+        self.tree = np.zeros(self.size + 1, dtype='int64')
+        self.tree[1:] = prefix[index] - prefix[index - (index & -index)]
+
+    def add(self, position, delta):
+        i = position + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix_sum(self, position):
+        # somme des valeurs de 0 à position inclus
+        total = 0
+        i = position + 1
+        while i > 0:
+            total += int(self.tree[i])
+            i -= i & -i
+        return total
+
+
+def duration_seconds(values):
+    # durées timedelta64 -> secondes entières ; une absence (NaT) compte pour 0 dans le cumul
+    return values.fillna(pd.Timedelta(0)).to_numpy(dtype='timedelta64[s]').astype('int64')
+
 
 class PandasModel(QAbstractTableModel):
-    def __init__(self, df=pd.DataFrame()):
+    # nombre de lignes matérialisées à chaque fetchMore de la vue
+    fetch_size = 1000
+    editable_columns = ['Commentaire', 'Travail', 'Date']
+    # nombre de modifications groupées que l'on peut annuler
+    undo_limit = 100
+
+    def __init__(self, df=pd.DataFrame(), per_employee=False):
         super(PandasModel, self).__init__()
         self.df = df
+        # textes d'affichage par colonne, préformatés par blocs quand la vue les demande
+        self.display = [np.empty(len(df), dtype=object) for _ in df.columns]
+        self.highlight = QColor(220, 220, 255)
+        self.loaded_rows = min(len(df), self.fetch_size)
+        self.format_rows(0, self.loaded_rows)
+        self.build_cumulative_index(per_employee)
+        # journal des modifications : une entrée par modification groupée, liste de (ligne, colonne, avant, après)
+        self.undo_stack = []
+        self.redo_stack = []
+
+    def build_cumulative_index(self, per_employee):
+        # un arbre de Fenwick par groupe (toute la feuille, ou chaque employé) sur les secondes de 'Travail'
+        self.cumulative_col = None
+        if not {'Travail', 'Travail Cumulée'}.issubset(self.df.columns):
+            return
+        self.travail_col = self.df.columns.get_loc('Travail')
+        self.cumulative_col = self.df.columns.get_loc('Travail Cumulée')
+        self.travail_seconds = duration_seconds(self.df['Travail'])
+
+        if per_employee:
+            self.row_group, uniques = pd.factorize(self.df['Nom'])
+            # les lignes sans nom forment leur propre groupe
+            self.row_group[self.row_group < 0] = len(uniques)
+        else:
+            self.row_group = np.zeros(len(self.df), dtype='int64')
+        group_count = int(self.row_group.max()) + 1 if len(self.df) else 0
+
+        order = np.argsort(self.row_group, kind='stable')
+        bounds = np.searchsorted(self.row_group[order], np.arange(group_count + 1))
+        self.group_rows = [order[bounds[g]:bounds[g + 1]] for g in range(group_count)]
+        self.row_position = np.empty(len(self.df), dtype='int64')
+        for rows in self.group_rows:
+            self.row_position[rows] = np.arange(len(rows))
+        self.trees = [FenwickTree(self.travail_seconds[rows]) for rows in self.group_rows]
+        # position à partir de laquelle 'Travail Cumulée' du DataFrame n'est plus à jour, par groupe
+        self.stale_from = [len(rows) for rows in self.group_rows]
+
+    def cumulative_text(self, row):
+        group = self.row_group[row]
+        position = self.row_position[row]
+        if position < self.stale_from[group]:
+            return None
+        return format_seconds(np.array([self.trees[group].prefix_sum(position)]))[0]
+
+    def store_travail_seconds(self, row, seconds):
+        # mise à jour en O(log n) ; les cumuls du DataFrame ne sont réécrits qu'à la demande
+        group = self.row_group[row]
+        position = self.row_position[row]
+        self.trees[group].add(position, seconds - int(self.travail_seconds[row]))
+        self.travail_seconds[row] = seconds
+        self.stale_from[group] = min(self.stale_from[group], position)
+        return group
+
+    def set_travail_seconds(self, row, seconds):
+        group = self.store_travail_seconds(row, seconds)
+        # prévenir la vue pour les lignes chargées du groupe situées après la modification
+        rows = self.group_rows[group]
+        last = int(rows[np.searchsorted(rows, self.loaded_rows) - 1])
+        self.dataChanged.emit(self.index(row, self.cumulative_col), self.index(last, self.cumulative_col))
+
+    def format_rows(self, start, stop, columns=None):
+        # le texte affiché est calculé une fois par cellule à partir des colonnes typées
+        for col in (range(len(self.df.columns)) if columns is None else columns):
+            self.display[col][start:stop] = [str(value) for value in format_column(self.df.iloc[start:stop, col]).tolist()]
+
+    def format_cells(self, rows, col):
+        # reformater des cellules quelconques d'une colonne, parmi les lignes déjà chargées
+        rows = rows[rows < self.loaded_rows]
+        if len(rows) == 1:
+            self.format_rows(int(rows[0]), int(rows[0]) + 1, [col])
+        elif len(rows):
+            self.display[col][rows] = [str(value) for value in format_column(self.df.iloc[rows, col]).tolist()]
 
     def rowCount(self, parent=None):
-        return len(self.df)
+        return self.loaded_rows
 
     def columnCount(self, parent=None):
         return len(self.df.columns)
 
+    def canFetchMore(self, parent=None):
+        return self.loaded_rows < len(self.df)
+
+    def fetchMore(self, parent=None):
+        count = min(self.fetch_size, len(self.df) - self.loaded_rows)
+        if count <= 0:
+            return
+        start = self.loaded_rows
+        self.beginInsertRows(QModelIndex(), start, start + count - 1)
+        self.format_rows(start, start + count)
+        self.loaded_rows += count
+        self.endInsertRows()
+
     def data(self, index, role=Qt.DisplayRole):
         if not index.isValid():
             return None
         if role == Qt.DisplayRole:
-            return str(self.df.iloc[index.row(), index.column()])
+            if index.column() == self.cumulative_col:
+                text = self.cumulative_text(index.row())
+                if text is not None:
+                    return text
+            return self.display[index.column()][index.row()]
         if role == Qt.BackgroundRole and index.column() == 2:
-            return QColor(220, 220, 255)
+            return self.highlight
         return None
 
     def headerData(self, section, orientation, role=Qt.DisplayRole):
@@ -41,259 +178,689 @@ class PandasModel(QAbstractTableModel):
 
     def setData(self, index, value, role=Qt.EditRole):
         if index.isValid() and role == Qt.EditRole:
-            col_name = self.df.columns[index.column()]  # obtenir le nom de la colonne à partir de l'index
-            if col_name == 'Commentaire':
-                self.df.iat[index.row(), index.column()] = value
-                self.dataChanged.emit(index, index)
-                return True
-            elif col_name == 'Travail':
-                try:
-                    # analyser le temps de 'Travail' au format hh:mm
-                    new_time = pd.to_timedelta(value + ':00') 
-                    # convertir timedelta au format hh:mm
-                    time_str = str(new_time).split()[2][:5] 
-                    self.df.iat[index.row(), index.column()] = time_str
-                    # mettre à jour le temps cumulé à partir de cette ligne
-                    self.update_cumulative_travail(start_index=index.row())
-                    self.dataChanged.emit(index, index)
-                    return True
-                except ValueError:
-                    return False
-            elif col_name == 'Date':
-                try:
-                    # analyser 'Date' au format yyyy-mm-dd
-                    new_date = pd.to_datetime(value, format='%Y-%m-%d', errors='coerce')
-                    if pd.notna(new_date):
-                        self.df.iat[index.row(), index.column()] = new_date.strftime('%Y-%m-%d')
-                        return True
-                    else:
-                        return False
-                except Exception as e:
-                    print(f"Error updating Date column: {e}")
-                    return False
+            return self.set_values([(index.row(), index.column(), value)])
         return False
 
-    def update_cumulative_travail(self, start_index=0):
-        total_hours = 0  # total hours accumulated
-        total_minutes = 0  # total minutes accumulated
-
-        for index, row in self.df.iterrows():
-            if index < start_index:
-                # ignore rows before the start index
-                if row['Travail Cumulée'] and isinstance(row['Travail Cumulée'], str):
-                    time_parts = row['Travail Cumulée'].split(':')
-                    total_hours = int(time_parts[0])
-                    total_minutes = int(time_parts[1])
-                continue
+    def parse_value(self, col_name, value):
+        # valeur typée d'une saisie ; ValueError si elle ne convient pas à la colonne
+        if col_name == 'Commentaire':
+            return value
+        text = str(value).strip()
+        # 'Abs' (absence), tel qu'affiché, est accepté pour pouvoir recoller une colonne copiée
+        if text == 'Abs':
+            return pd.NaT
+        if col_name == 'Travail':
+            # analyser le temps de 'Travail' au format hh:mm (ou hh:mm:ss affiché), à la minute près
+            return pd.to_timedelta(text if text.count(':') == 2 else text + ':00').floor('min')
+        if col_name == 'Date':
+            # analyser 'Date' au format yyyy-mm-dd
+            new_date = pd.to_datetime(text, format='%Y-%m-%d', errors='coerce')
+            if pd.isna(new_date):
+                raise ValueError(f"invalid date {text!r}, expected yyyy-mm-dd")
+            return new_date
+        raise ValueError(f"column {col_name!r} is not editable")
 
-            if row['Travail'] == 'Abs':
-                self.df.at[index, 'Travail Cumulée'] = f"{total_hours:02}:{total_minutes:02}"
+    def set_values(self, edits):
+        # modification groupée de cellules (ligne, colonne, texte saisi) : tout est validé avant d'écrire,
+        # une valeur invalide rejette l'ensemble ; le groupe est une seule étape d'annulation
+        changes = []
+        # valeurs actuelles lues par colonne (plus rapide que df.iat cellule par cellule), gardées pour annuler
+        current = {}
+        for row, col, value in edits:
+            if not (0 <= row < len(self.df) and 0 <= col < len(self.df.columns)):
+                logger.warning("Edit outside of the table ignored: row %d, column %d", row + 1, col + 1)
+                return False
+            col_name = self.df.columns[col]
+            try:
+                if col_name not in self.editable_columns:
+                    raise ValueError(f"column {col_name!r} is not editable")
+                new_value = self.parse_value(col_name, value)
+            except ValueError as e:
+                logger.warning("Invalid value %r for %s at row %d: %s", value, col_name, row + 1, e)
+                return False
+            if len(edits) == 1:
+                old_value = self.df.iat[row, col]
             else:
-                try:
-                    travail_parts = row['Travail'].split(':')
-                    travail_hours = int(travail_parts[0])
-                    travail_minutes = int(travail_parts[1]) if len(travail_parts) > 1 else 0
-                    total_hours += travail_hours
-                    total_minutes += travail_minutes
+                if col not in current:
+                    current[col] = self.df.iloc[:, col].array
+                old_value = current[col][row]
+            changes.append((row, col, old_value, new_value))
+        if not changes:
+            return False
+        self.apply_changes([(row, col, new) for row, col, _, new in changes])
+        self.undo_stack.append(changes)
+        del self.undo_stack[:-self.undo_limit]
+        self.redo_stack.clear()
+        return True
+
+    def paste(self, text, top, left, rows=1, columns=1):
+        # coller un bloc copié depuis un tableur (lignes séparées par des retours, cellules par des
+        # tabulations) à partir de (top, left) ; une valeur seule remplit la sélection rows x columns
+        block = [line.split('\t') for line in text.splitlines()]
+        if not block:
+            return False
+        if len(block) == 1 and len(block[0]) == 1:
+            block = [block[0] * columns for _ in range(rows)]
+        return self.set_values([(top + i, left + j, value)
+                                for i, line in enumerate(block) for j, value in enumerate(line)])
+
+    def undo(self):
+        if not self.undo_stack:
+            return False
+        changes = self.undo_stack.pop()
+        # dans l'ordre inverse : une cellule modifiée deux fois retrouve sa toute première valeur
+        self.apply_changes([(row, col, old) for row, col, old, _ in reversed(changes)])
+        self.redo_stack.append(changes)
+        return True
+
+    def redo(self):
+        if not self.redo_stack:
+            return False
+        changes = self.redo_stack.pop()
+        self.apply_changes([(row, col, new) for row, col, _, new in changes])
+        self.undo_stack.append(changes)
+        return True
+
+    def apply_changes(self, cells):
+        # écrire des valeurs déjà validées colonne par colonne (la dernière valeur d'une cellule l'emporte),
+        # puis prévenir la vue par un seul signal couvrant toutes les cellules modifiées
+        by_col = {}
+        for row, col, value in cells:
+            by_col.setdefault(col, {})[row] = value
+        first_row, last_row = len(self.df), -1
+        for col, values in by_col.items():
+            rows = np.fromiter(values, dtype='int64', count=len(values))
+            if len(rows) == 1:
+                # une seule cellule (saisie dans la vue) : df.iat évite l'indexation par tableau
+                self.df.iat[int(rows[0]), col] = values[int(rows[0])]
+            else:
+                self.df.iloc[rows, col] = list(values.values())
+            self.format_cells(rows, col)
+            first_row, last_row = min(first_row, int(rows.min())), max(last_row, int(rows.max()))
+        first_col, last_col = min(by_col), max(by_col)
 
-                    if total_minutes >= 60:
-                        extra_hours = total_minutes // 60
-                        total_hours += extra_hours
-                        total_minutes = total_minutes % 60
+        if self.cumulative_col is not None and self.travail_col in by_col:
+            travail = by_col[self.travail_col]
+            for row, value in travail.items():
+                self.store_travail_seconds(row, 0 if pd.isna(value) else int(value.total_seconds()))
+            if len(travail) > 1:
+                # plusieurs durées : un seul recalcul des cumuls, depuis la première ligne touchée ;
+                # une seule durée reste calculée à la demande par les arbres de Fenwick
+                self.update_cumulative_travail(min(travail))
+            # les cumuls changent jusqu'à la fin des lignes chargées
+            last_row = self.loaded_rows - 1
+            first_col, last_col = min(first_col, self.cumulative_col), max(last_col, self.cumulative_col)
 
-                    self.df.at[index, 'Travail Cumulée'] = f"{total_hours:02}:{total_minutes:02}"
-                except ValueError:
-                    self.df.at[index, 'Travail Cumulée'] = f"{total_hours:02}:{total_minutes:02}"
+        last_row = min(last_row, self.loaded_rows - 1)
+        if first_row <= last_row:
+            self.dataChanged.emit(self.index(first_row, first_col), self.index(last_row, last_col))
+
+    def update_cumulative_travail(self, start_index=0):
+        # réécrire 'Travail Cumulée' dans le DataFrame à partir de start_index (et des lignes périmées)
+        if self.cumulative_col is None:
+            return
+        for group, rows in enumerate(self.group_rows):
+            start = min(self.stale_from[group], int(np.searchsorted(rows, start_index)))
+            if start >= len(rows):
+                continue
+            totals = np.cumsum(self.travail_seconds[rows])[start:]
+            changed = rows[start:]
+            self.df.iloc[changed, self.cumulative_col] = totals.astype('timedelta64[s]')
+            self.display[self.cumulative_col][changed] = format_seconds(totals)
+            self.stale_from[group] = len(rows)
 
     def flags(self, index):
         if not index.isValid():
             return Qt.ItemIsEnabled
-        if self.df.columns[index.column()] in ['Commentaire', 'Travail', 'Date']:
+        if self.df.columns[index.column()] in self.editable_columns:
             return Qt.ItemIsEditable | Qt.ItemIsEnabled | Qt.ItemIsSelectable
         return Qt.ItemIsEnabled | Qt.ItemIsSelectable
 
     def get_dataframe(self):
+        self.update_cumulative_travail(start_index=len(self.df))
         return self.df
 
+EXTRACTED_COLUMNS = ['Nom', 'Date', 'Entrée', 'Sortie', 'Travail', 'Travail Cumulée', 'Commentaire']
+# largeurs des colonnes du fichier exporté, par numéro de colonne
+EXPORT_COLUMN_WIDTHS = {1: 30, 2: 20, 3: 20, 4: 20, 5: 20, 6: 30, 7: 50}
+
+def parse_datetime_column(values, **kwargs):
+    # analyser chaque valeur distincte une seule fois puis la redistribuer sur toute la colonne
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(uniques, dtype=object)
+    # 'mixed' analyse chaque valeur avec son propre format, comme un appel valeur par valeur
+    parsed = pd.to_datetime(uniques, **{'format': 'mixed', **kwargs})
+    # repli valeur par valeur pour ce que l'analyse groupée n'a pas reconnu
+    for i in np.flatnonzero(parsed.isna().to_numpy()):
+        parsed.iat[i] = pd.to_datetime(uniques.iat[i], **kwargs)
+    parsed = pd.DatetimeIndex(parsed).append(pd.DatetimeIndex([pd.NaT]))
+    # les valeurs manquantes ont le code -1, qui pointe sur le NaT ajouté à la fin
+    return pd.Series(parsed.take(codes), index=values.index)
+
+def format_datetime_column(values, fmt):
+    # formater chaque valeur distincte une seule fois
+    codes, uniques = pd.factorize(values)
+    formatted = np.append(pd.DatetimeIndex(uniques).strftime(fmt).to_numpy(dtype=object), None)
+    return formatted[codes]
+
+def time_of_day(values, absent):
+    # heure d'une colonne datetime, en durée depuis minuit tronquée à la seconde ; NaT pour les absences
+    seconds = (values - values.dt.normalize()).to_numpy(dtype='timedelta64[ns]').astype('timedelta64[s]')
+    seconds[absent] = np.timedelta64('NaT')
+    return seconds
+
+def format_seconds(seconds):
+    # formater un tableau de secondes entières au format hh:mm:ss, une fois par valeur distincte
+    uniques, codes = np.unique(seconds, return_inverse=True)
+    hours, rest = np.divmod(uniques, 3600)
+    minutes, secs = np.divmod(rest, 60)
+    formatted = [f"{h:02}:{m:02}:{s:02}" for h, m, s in zip(hours.tolist(), minutes.tolist(), secs.tolist())]
+    return np.array(formatted, dtype=object)[codes.reshape(-1)]
+
+def format_column(values):
+    # texte d'affichage et d'export d'une colonne typée : dates yyyy-mm-dd, durées et heures hh:mm:ss,
+    # 'Abs' pour une date ou une durée manquante ; les autres colonnes sont renvoyées telles quelles
+    if pd.api.types.is_datetime64_any_dtype(values):
+        texts = format_datetime_column(values, '%Y-%m-%d')
+    elif pd.api.types.is_timedelta64_dtype(values):
+        texts = format_seconds(duration_seconds(values))
+    else:
+        return values.to_numpy(dtype=object)
+    return np.where(values.isna().to_numpy(), 'Abs', texts)
+
+def export_rows(df):
+    # lignes de l'export : texte formaté des colonnes typées, cellule vide pour une valeur manquante
+    columns = []
+    for column in df.columns:
+        values = format_column(df[column])
+        columns.append(np.where(pd.isna(values), None, values))
+    return zip(*columns)
+
+def concat_extracted(frames, **kwargs):
+    # pd.concat ne conserve le type catégoriel que si les catégories de tous les lots sont identiques
+    df = pd.concat(frames, **kwargs)
+    df['Nom'] = df['Nom'].astype('category')
+    return df
+
+def convert_cell(value):
+    # mêmes conversions que le lecteur openpyxl de pandas
+    if value is None or value == '':
+        return np.nan
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def iter_xlsx_rows(file_path):
+    # itérateur en lecture seule d'openpyxl : une ligne à la fois en mémoire
+    from openpyxl import load_workbook
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows(values_only=True):
+            yield tuple(convert_cell(value) for value in row)
+    finally:
+        wb.close()
+
+def iter_xls_rows(file_path):
+    # mêmes conversions que le lecteur xlrd de pandas ; un .xls est limité à 65536 lignes
+    import xlrd
+    book = xlrd.open_workbook(file_path, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        for r in range(sheet.nrows):
+            row = []
+            for cell_type, value in zip(sheet.row_types(r), sheet.row_values(r)):
+                if cell_type == xlrd.XL_CELL_DATE:
+                    value = xlrd.xldate.xldate_as_datetime(value, book.datemode)
+                    if value.timetuple()[0:3] == ((1904, 1, 1) if book.datemode else (1899, 12, 31)):
+                        value = value.time()
+                elif cell_type in (xlrd.XL_CELL_ERROR, xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK):
+                    value = None
+                elif cell_type == xlrd.XL_CELL_BOOLEAN:
+                    value = bool(value)
+                row.append(convert_cell(value))
+            yield tuple(row)
+    finally:
+        book.release_resources()
+
 class ExcelFileHandler:
+    table = 'dbbi'
+
     def __init__(self):
         self.df = pd.DataFrame()
 
     def connect_db(self):
-        try:
-            params = config()
-            connection = psycopg2.connect(**params)
-            print("Database connection successful")
-            return connection
-        except Exception as error:
-            print(f"Database connection error: {error}")
-            return None
+        # connexion empruntée au pool partagé, rendue à la sortie du bloc with
+        return db.connection()
 
-    def load_excel(self, file_path):
+    def load_excel(self, file_path, per_employee=False):
         if os.path.exists(file_path):
             try:
-                if file_path.endswith('.xlsx'):
-                    df = pd.read_excel(file_path, engine='openpyxl')
-                elif file_path.endswith('.xls'):
-                    df = pd.read_excel(file_path, engine='xlrd')
-                else:
-                    print(f"Unsupported file format: {file_path}")
-                    return None
+                # un fichier déjà traité (même contenu) est relu depuis le cache au lieu d'être réanalysé
+                cache_key = parse_cache.key(file_path, per_employee)
+                cached = parse_cache.load(cache_key)
+                if cached is not None:
+                    logger.info("File loaded from parse cache: %s", file_path)
+                    self.df = cached
+                    return cached
 
-                print(f"File loaded: {file_path}")
-                print("Initial DataFrame:")
-                print(df.head())  # afficher les premières lignes pour vérifier les données
+                with instrument.span('parse', file=file_path) as fields:
+                    if file_path.endswith('.xlsx'):
+                        df = pd.read_excel(file_path, engine='openpyxl')
+                    elif file_path.endswith('.xls'):
+                        df = pd.read_excel(file_path, engine='xlrd')
+                    else:
+                        logger.error("Unsupported file format: %s", file_path)
+                        return None
+                    fields['rows'] = len(df)
+
+                logger.info("File loaded: %s", file_path)
+                # afficher les premières lignes pour vérifier les données
+                logger.debug("Initial DataFrame:\n%s", df.head())
 
                 if all(col in df.columns for col in ['Entrée.', 'Sortie.', 'Nom.']):
-                    extracted_data = []
-                    cumulative_diff = pd.Timedelta(0)
-                    formatted_cum_diff = '00:00:00'
-
-                    for _, row in df.iterrows():
-                        Entrée = pd.to_datetime(row['Entrée.'], errors='coerce')
-                        Sortie = pd.to_datetime(row['Sortie.'], errors='coerce')
-                        Nom = row['Nom.']
-                        Date = pd.to_datetime(row['Date.'],format='%d/%m/%Y', errors='coerce')
-
-                        print(f"Processing row: Entrée={Entrée}, Sortie={Sortie}, Nom={Nom}")  
-
-                        if pd.notna(Entrée) and pd.notna(Sortie):
-                            time_diff = Sortie - Entrée
-                            total_seconds = int(time_diff.total_seconds())
-                            diff_hours = total_seconds // 3600
-                            diff_minutes = (total_seconds % 3600) // 60
-                            diff_seconds = total_seconds % 60
-                            formatted_diff = f"{diff_hours:02}:{diff_minutes:02}:{diff_seconds:02}"
-
-                            cumulative_diff += time_diff
-                            cumulative_total_seconds = int(cumulative_diff.total_seconds())
-                            cum_hours = cumulative_total_seconds // 3600
-                            cum_minutes = (cumulative_total_seconds % 3600) // 60
-                            cum_seconds = cumulative_total_seconds % 60
-                            formatted_cum_diff = f"{cum_hours:02}:{cum_minutes:02}:{cum_seconds:02}"
-
-                            extracted_data.append({
-                                'Entrée': Entrée.strftime('%H:%M:%S'),
-                                'Sortie': Sortie.strftime('%H:%M:%S'),
-                                'Nom': Nom,
-                                'Date': Date.strftime('%Y-%m-%d'),
-                                'Travail': formatted_diff,
-                                'Travail Cumulée': formatted_cum_diff,
-                                'Commentaire': ''  
-                            })
-                        else:
-                            extracted_data.append({
-                                'Entrée': 'Abs',
-                                'Sortie': 'Abs',
-                                'Nom': Nom,
-                                'Date': 'Abs',
-                                'Travail': 'Abs',
-                                'Travail Cumulée': formatted_cum_diff,
-                                'Commentaire': '' 
-                            })
-
-                    extracted_df = pd.DataFrame(extracted_data)
-                    reordered_columns = ['Nom', 'Date', 'Entrée', 'Sortie', 'Travail', 'Travail Cumulée', 'Commentaire']
-                    extracted_df = extracted_df[reordered_columns]
-
-                    print("Extracted and converted rows:")
-                    print(extracted_df)
-
-                    self.df = extracted_df 
+                    with instrument.span('transform', rows=len(df)):
+                        extracted_df = self.process_frame(df, per_employee=per_employee)
+                    instrument.count('rows.loaded', len(extracted_df))
+
+                    logger.debug("Extracted and converted rows:\n%s", extracted_df)
+
+                    self.df = extracted_df
+                    parse_cache.store(cache_key, extracted_df)
 
                     return extracted_df
                 else:
-                    print("Required columns are not present in the DataFrame.")
+                    logger.error("Required columns are not present in the DataFrame.")
                     return None
             except Exception as e:
-                print(f"Error loading file {file_path}: {e}")
+                logger.error("Error loading file %s: %s", file_path, e)
                 return None
         else:
-            print(f"The file {file_path} does not exist.")
+            logger.error("The file %s does not exist.", file_path)
             return None 
 
+    def process_frame(self, df, per_employee=False, carry=None):
+        # analyser les colonnes une seule fois au lieu de chaque cellule
+        entree = parse_datetime_column(df['Entrée.'], errors='coerce')
+        sortie = parse_datetime_column(df['Sortie.'], errors='coerce')
+        dates = parse_datetime_column(df['Date.'], format='%d/%m/%Y', errors='coerce')
+        present = (entree.notna() & sortie.notna()).to_numpy()
+
+        if dates[present].isna().any():
+            # même comportement que Timestamp.strftime sur NaT
+            raise ValueError("NaTType does not support strftime")
+
+        # durées en nanosecondes, 0 pour les absences afin de reporter le cumul précédent
+        diff_ns = (sortie - entree).to_numpy(dtype='timedelta64[ns]').view('int64')
+        diff_ns = np.where(present, diff_ns, 0)
+        if per_employee:
+            # les noms manquants ont le code -1 et forment leur propre groupe
+            codes, names = pd.factorize(df['Nom.'])
+            keys = list(names) + [None]
+            cumulative_ns = pd.Series(diff_ns).groupby(codes, sort=False).cumsum().to_numpy()
+        else:
+            codes = np.full(len(df), -1)
+            keys = [None]
+            cumulative_ns = np.cumsum(diff_ns)
+
+        if carry is not None:
+            # reprendre le cumul laissé par le lot précédent, puis mémoriser le dernier cumul de chaque groupe
+            offsets = np.array([carry.get(key, 0) for key in keys], dtype='int64')
+            cumulative_ns = cumulative_ns + offsets[codes]
+            last_rows = pd.Series(np.arange(len(df))).groupby(codes).max()
+            for code, row in last_rows.items():
+                carry[keys[code]] = int(cumulative_ns[row])
+
+        # int(total_seconds()) tronque vers zéro, comme astype
+        diff_seconds = (diff_ns / 1e9).astype('int64')
+        cumulative_seconds = (cumulative_ns / 1e9).astype('int64')
+
+        # colonnes typées, à la seconde ; une absence est NaT et n'est formatée 'Abs' qu'à l'affichage et à l'export
+        absent = ~present
+        travail = diff_seconds.astype('timedelta64[s]')
+        travail[absent] = np.timedelta64('NaT')
+        extracted_df = pd.DataFrame({
+            'Nom': pd.Categorical(df['Nom.'].to_numpy()),
+            'Date': dates.where(present).astype('datetime64[s]').to_numpy(),
+            'Entrée': time_of_day(entree, absent),
+            'Sortie': time_of_day(sortie, absent),
+            'Travail': travail,
+            'Travail Cumulée': cumulative_seconds.astype('timedelta64[s]'),
+            'Commentaire': np.full(len(df), '', dtype=object),
+        })
+        return extracted_df[EXTRACTED_COLUMNS]
+
+    def iter_excel_batches(self, file_path, batch_size=10000):
+        # lire la première feuille par lots de lignes brutes, sans charger tout le classeur
+        if file_path.endswith('.xlsx'):
+            rows = iter_xlsx_rows(file_path)
+        elif file_path.endswith('.xls'):
+            rows = iter_xls_rows(file_path)
+        else:
+            raise ValueError(f"Unsupported file format: {file_path}")
+
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(name) if name is not None else f"Unnamed: {i}" for i, name in enumerate(header)]
+
+        batch = []
+        for row in rows:
+            # ignorer les lignes entièrement vides, comme pd.read_excel
+            if all(pd.isna(value) for value in row):
+                continue
+            batch.append(row[:len(columns)] + (np.nan,) * (len(columns) - len(row)))
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns)
+
+    def stream_excel(self, file_path, batch_size=10000, per_employee=False):
+        # produire les lignes traitées lot par lot, le cumul étant reporté d'un lot à l'autre ;
+        # les erreurs remontent à l'appelant, qui peut avoir déjà consommé des lots
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"The file {file_path} does not exist.")
+
+        carry = {}
+        offset = 0
+        for raw in instrument.timed_iter('parse', self.iter_excel_batches(file_path, batch_size), file=file_path):
+            if not all(col in raw.columns for col in ['Entrée.', 'Sortie.', 'Nom.']):
+                raise ValueError("Required columns are not present in the DataFrame.")
+            with instrument.span('transform', rows=len(raw)):
+                batch = self.process_frame(raw, per_employee=per_employee, carry=carry)
+            instrument.count('rows.loaded', len(batch))
+            batch.index += offset
+            offset += len(batch)
+            yield batch
+
+    def load_excel_batches(self, file_path, per_employee=False, batch_size=10000, progress=None, is_cancelled=None):
+        # équivalent interruptible de load_excel, pour les workers
+        cache_key = parse_cache.key(file_path, per_employee) if os.path.exists(file_path) else None
+        cached = parse_cache.load(cache_key)
+        if cached is not None:
+            if progress is not None:
+                progress(len(cached), 0)
+            return cached
+
+        batches = []
+        rows = 0
+        for batch in self.stream_excel(file_path, batch_size=batch_size, per_employee=per_employee):
+            if is_cancelled is not None and is_cancelled():
+                return None
+            batches.append(batch)
+            rows += len(batch)
+            if progress is not None:
+                progress(rows, 0)
+        if not batches:
+            raise ValueError(f"No rows found in {file_path}.")
+        df = concat_extracted(batches)
+        parse_cache.store(cache_key, df)
+        return df
+
     def save_excel(self, df, output_file_path):
+        # df : un DataFrame ou des lots successifs (par exemple stream_excel) ; le classeur est écrit en une
+        # seule passe en mode write-only d'openpyxl, sans garder les lignes déjà écrites en mémoire
+        from openpyxl import Workbook
+        from openpyxl.utils import get_column_letter
+        batches = [df] if isinstance(df, pd.DataFrame) else df
         try:
-            df.to_excel(output_file_path, index=False)
-            wb = load_workbook(output_file_path)
-            ws = wb.active
-
-            column_widths = {
-                1: 30,  
-                2: 20,  
-                3: 20,  
-                4: 20,  
-                5: 20,  
-                6: 30,  
-                7: 50   
-            }
-
-            for col, width in column_widths.items():
-                ws.column_dimensions[ws.cell(row=1, column=col).column_letter].width = width
+            with instrument.span('save', file=output_file_path) as fields:
+                wb = Workbook(write_only=True)
+                ws = wb.create_sheet('Sheet1')
+                # les largeurs doivent être fixées avant la première ligne
+                for col, width in EXPORT_COLUMN_WIDTHS.items():
+                    ws.column_dimensions[get_column_letter(col)].width = width
 
-            wb.save(output_file_path)
+                rows = 0
+                header = None
+                for batch in batches:
+                    # en-tête tiré des colonnes du premier lot
+                    if header is None:
+                        header = list(batch.columns)
+                        ws.append(header)
+                    for row in export_rows(batch):
+                        ws.append(row)
+                    rows += len(batch)
+                fields['rows'] = rows
+                wb.save(output_file_path)
 
-            print(f"DataFrame saved as {output_file_path} with adjusted column widths")
+            logger.info("DataFrame saved as %s with adjusted column widths", output_file_path)
+            return True
         except Exception as e:
-            print(f"Error saving DataFrame as {output_file_path}: {e}")
+            logger.error("Error saving DataFrame as %s: %s", output_file_path, e)
+            return False
 
-    def insert_to_db(self, df):
-        connection = self.connect_db()
+    def insert_to_db(self, df, bulk=False, batch_size=1000, progress=None, is_cancelled=None, delta=False):
+        # df : un DataFrame ou des lots successifs (par exemple stream_excel), insérés au fur et à mesure sur une
+        # même connexion sans être concaténés ; delta : n'envoyer que les lignes postérieures à la dernière date
+        # déjà en base pour chaque employé, lue une fois avant le premier lot ; la base est celle de [storage]
+        # dans db.ini
+        if isinstance(df, pd.DataFrame):
+            batches, total = [df], None
+        else:
+            # nombre total de lignes inconnu pour un flux de lots
+            batches, total = df, 0
+        if db.backend() == 'sqlite':
+            return self.insert_local(batches, total, batch_size=batch_size, progress=progress,
+                                     is_cancelled=is_cancelled, delta=delta)
+        return self.insert_postgresql(batches, total, bulk=bulk, batch_size=batch_size, progress=progress,
+                                      is_cancelled=is_cancelled, delta=delta)
 
-        if connection is None:
-            print("Failed to connect to the database.")
-            return
+    def insert_postgresql(self, batches, total=None, bulk=False, batch_size=1000, progress=None, is_cancelled=None,
+                          delta=False):
+        def insert_batch(connection, df, progress):
+            # partitions mensuelles des dates à insérer, si la table est partitionnée
+            schema.ensure_partitions(connection, self.table, df['Date'].dropna().dt.date.unique())
+            if bulk:
+                return self.bulk_insert_rows(connection, df, batch_size=batch_size, progress=progress,
+                                             is_cancelled=is_cancelled)
+            return self.insert_rows(connection, df)
 
+        try:
+            with self.connect_db() as connection:
+                with instrument.span('insert', table=self.table, bulk=bulk, delta=delta) as fields:
+                    schema.ensure_rollups(connection, self.table)
+                    marks = schema.high_water_marks(connection, self.table) if delta else None
+                    counts = self.insert_batches(connection, batches, insert_batch, marks, total, fields,
+                                                 progress=progress, is_cancelled=is_cancelled)
+        except psycopg2.Error as error:
+            logger.error("Failed to connect to the database: %s", error)
+            return None
+        return counts
+
+    def insert_local(self, batches, total=None, batch_size=1000, progress=None, is_cancelled=None, delta=False):
+        # stockage embarqué ([storage] backend=sqlite) : même comptage que l'insertion groupée PostgreSQL
+        def insert_batch(connection, df, progress):
+            rows, missing = self.rows_for_db(df)
+            counts = local_store.insert_rows(connection, rows, self.table, batch_size=batch_size,
+                                             progress=progress, is_cancelled=is_cancelled)
+            counts['skipped'] += missing
+            return counts
+
+        try:
+            with local_store.connection(self.table) as connection:
+                with instrument.span('insert', table=self.table, bulk=True, delta=delta,
+                                     backend='sqlite') as fields:
+                    marks = local_store.high_water_marks(connection, self.table) if delta else None
+                    counts = self.insert_batches(connection, batches, insert_batch, marks, total, fields,
+                                                 progress=progress, is_cancelled=is_cancelled)
+        except sqlite3.Error as error:
+            logger.error("Failed to write to the local database %s: %s", local_store.path, error)
+            return None
+        if counts is not None:
+            logger.info("Local insert finished: %d inserted, %d skipped, %d failed.",
+                        counts['inserted'], counts['skipped'], counts['failed'])
+        return counts
+
+    def insert_batches(self, connection, batches, insert_batch, marks, total, fields, progress=None,
+                       is_cancelled=None):
+        # filtrer (delta), insérer, compter et invalider chaque lot dès qu'il arrive : seul le lot courant est
+        # en mémoire ; les doublons (nom, date) sont écartés par la base, dans un lot comme d'un lot à l'autre ;
+        # None si un lot échoue (les lots précédents restent en base)
+        counts = {'inserted': 0, 'skipped': 0, 'failed': 0}
+        sent = 0
+        for df in batches:
+            if is_cancelled is not None and is_cancelled():
+                logger.info("Insert cancelled after %d rows.", sent)
+                break
+            already_stored = 0
+            if marks is not None:
+                df, already_stored = self.filter_delta(df, marks)
+            # progression cumulée sur tous les lots ; total None : celle du lot unique, telle quelle
+            batch_progress = None if progress is None else (
+                lambda done, batch_total, sent=sent: progress(sent + done, batch_total if total is None else total))
+            batch_counts = insert_batch(connection, df, batch_progress)
+            if batch_counts is None:
+                fields['rows'] = sent
+                return None
+            batch_counts['skipped'] += already_stored
+            self.inserted(df, batch_counts)
+            for outcome, rows in batch_counts.items():
+                counts[outcome] += rows
+            sent += len(df)
+        fields['rows'] = sent
+        return counts
+
+    def inserted(self, df, counts):
+        # compteurs et invalidation des graphiques en cache après l'insertion d'un lot
+        for outcome, rows in counts.items():
+            instrument.count(f'rows.{outcome}', rows)
+        if counts['inserted'] and self.table == 'dbbi':
+            # les graphiques en cache qui couvrent ces mois et ces employés sont à recalculer
+            rows, _ = self.rows_for_db(df)
+            aggregates.invalidate_rows([row[1] for row in rows], [row[0] for row in rows])
+
+    def filter_delta(self, df, marks):
+        # garder les lignes d'un employé inconnu ou datées après sa dernière date en base ;
+        # les lignes sans date restent pour être comptées comme ignorées par rows_for_db
+        if df.empty or not marks:
+            return df, 0
+        marks = pd.to_datetime(df['Nom'].map(marks).astype(object), errors='coerce')
+        keep = ~(df['Date'] <= marks).to_numpy()
+        filtered = int((~keep).sum())
+        instrument.count('rows.delta_filtered', filtered)
+        logger.info("Delta insert: %d rows already covered by the database, %d rows to send.",
+                    filtered, int(keep.sum()))
+        return df[keep], filtered
+
+    def insert_rows(self, connection, df):
+        counts = {'inserted': 0, 'skipped': 0, 'failed': 0}
         try:
             cursor = connection.cursor()
-            insert_query = """
-                INSERT INTO dbbi (Nom, Date, Travail, Travail_cumule)
-                VALUES (%s, %s, %s, %s)
-            """
-            check_query = """
-                SELECT COUNT(*) FROM dbbi WHERE Nom = %s AND Date = %s
+            # chaque insertion met aussi à jour les agrégats journaliers et mensuels
+            insert_query = schema.insert_with_rollups(self.table, "(%s, %s, %s, %s)")
+            check_query = f"""
+                SELECT COUNT(*) FROM {self.table} WHERE Nom = %s AND Date = %s
             """
 
-            for _, row in df.iterrows():
-                nom = row['Nom'] if row['Nom'] != 'Abs' else None
-                date = row['Date'] if row['Date'] != 'Abs' else None
-                travail = row['Travail'] if row['Travail'] != 'Abs' else None
-                travail_cumulee = row['Travail Cumulée'] if row['Travail Cumulée'] != 'Abs' else None
-                
-              # si Nom ou Date est None, ignorer l'insertion
-                if nom is None or date is None:
-                    print(f"Skipping row with missing Nom or Date: {row}")
-                    continue
-
-                print(f"Checking for existing data: (Nom: {nom}, Date: {date})")
+            # les lignes sans Nom ou sans Date sont ignorées
+            rows, counts['skipped'] = self.rows_for_db(df)
+            for nom, date, travail, travail_cumulee in rows:
+                logger.debug("Checking for existing data: (Nom: %s, Date: %s)", nom, date)
                 
                 try:
                     cursor.execute(check_query, (nom, date))
                     exists = cursor.fetchone()[0]
 
                     if exists:
-                        print(f"Data already exists: (Nom: {nom}, Date: {date})")
+                        logger.debug("Data already exists: (Nom: %s, Date: %s)", nom, date)
+                        counts['skipped'] += 1
                         continue
 
-                    print(f"Inserting data: (Nom: {nom}, Date: {date}, Travail: {travail}, Travail_cumulee: {travail_cumulee})")
+                    logger.debug("Inserting data: (Nom: %s, Date: %s, Travail: %s, Travail_cumulee: %s)",
+                                 nom, date, travail, travail_cumulee)
                     cursor.execute(insert_query, (nom, date, travail, travail_cumulee))
+                    counts['inserted'] += 1
                 except Exception as e:
-                    print(f"Error executing query with data (Nom: {nom}, Date: {date}, Travail: {travail}, Travail_cumulee: {travail_cumulee}): {e}")
+                    logger.error("Error executing query with data (Nom: %s, Date: %s, Travail: %s, Travail_cumulee: %s): %s",
+                                 nom, date, travail, travail_cumulee, e)
                     connection.rollback()
                     return
 
             connection.commit()
-            print("Data inserted successfully into the database.")
+            logger.info("Data inserted successfully into the database.")
+            return counts
         except Exception as e:
-            print(f"Error inserting data: {e}")
+            logger.error("Error inserting data: %s", e)
         finally:
             cursor.close()
-            connection.close()
+
+    def rows_for_db(self, df):
+        # convertir le DataFrame en tuples (nom, date, travail, travail_cumule) de types Python
+        # (str, datetime.date, datetime.timedelta) que psycopg2 adapte directement ; NaT devient NULL ;
+        # le stockage local convertit dates et durées en texte et en secondes
+        # les lignes sans Nom ou sans Date ne peuvent pas être insérées
+        keep = (df['Nom'].notna() & df['Date'].notna()).to_numpy()
+        kept = df[keep]
+        columns = [kept['Nom'].to_numpy(dtype=object), kept['Date'].dt.date.to_numpy(dtype=object)]
+        for column in ('Travail', 'Travail Cumulée'):
+            values = kept[column]
+            columns.append(np.where(values.isna().to_numpy(), None, values.dt.to_pytimedelta()))
+        rows = list(zip(*(column.tolist() for column in columns)))
+        return rows, int((~keep).sum())
+
+    def bulk_insert_rows(self, connection, df, batch_size=1000, progress=None, is_cancelled=None):
+        rows, missing = self.rows_for_db(df)
+        counts = {'inserted': 0, 'skipped': missing, 'failed': 0}
+        # les lignes réellement insérées (hors doublons) sont reportées dans les agrégats par la même requête
+        insert_query = schema.insert_with_rollups(self.table, "%s", "ON CONFLICT (nom, date) DO NOTHING")
+        try:
+            cursor = connection.cursor()
+            try:
+                schema.ensure_unique_index(cursor, self.table)
+                connection.commit()
+            except Exception as e:
+                # des doublons existants empêchent la création de l'index : revenir à l'insertion ligne par ligne
+                logger.warning("Unable to create unique index on %s (nom, date), falling back to per-row insert: %s",
+                               self.table, e)
+                connection.rollback()
+                return self.insert_rows(connection, df)
+
+            for start in range(0, len(rows), batch_size):
+                # les lots déjà validés restent en base si l'utilisateur annule
+                if is_cancelled is not None and is_cancelled():
+                    logger.info("Bulk insert cancelled after %d rows.", start)
+                    break
+                batch = rows[start:start + batch_size]
+                try:
+                    inserted = execute_values(cursor, insert_query, batch, page_size=len(batch), fetch=True)
+                    connection.commit()
+                    counts['inserted'] += len(inserted)
+                    counts['skipped'] += len(batch) - len(inserted)
+                except Exception as e:
+                    logger.warning("Error inserting batch starting at row %d, retrying row by row: %s", start, e)
+                    connection.rollback()
+                    self.insert_rows_individually(connection, cursor, insert_query, batch, counts)
+                if progress is not None:
+                    progress(start + len(batch), len(rows))
+
+            logger.info("Bulk insert finished: %d inserted, %d skipped, %d failed.",
+                        counts['inserted'], counts['skipped'], counts['failed'])
+            return counts
+        except Exception as e:
+            logger.error("Error inserting data: %s", e)
+            return None
+        finally:
+            cursor.close()
+
+    def insert_rows_individually(self, connection, cursor, insert_query, batch, counts):
+        # isoler les lignes fautives d'un lot rejeté, les autres lignes sont conservées
+        for row in batch:
+            try:
+                inserted = execute_values(cursor, insert_query, [row], fetch=True)
+                connection.commit()
+                counts['inserted' if inserted else 'skipped'] += 1
+            except Exception as e:
+                logger.error("Error executing query with data (Nom: %s, Date: %s, Travail: %s, Travail_cumulee: %s): %s",
+                             *row, e)
+                connection.rollback()
+                counts['failed'] += 1
 
 
 class MainWindow(QMainWindow):
     def __init__(self):
         super(MainWindow, self).__init__()
+        self.tasks = {}  # worker -> libellé des tâches en cours
         self.init_ui()
         self.file_handler = ExcelFileHandler()
 
@@ -326,6 +893,13 @@ class MainWindow(QMainWindow):
 
         self.table_view.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
 
+        # coller une plage de cellules, annuler et rétablir les modifications de la table
+        for keys, slot in ((QKeySequence.Paste, self.paste_cells), (QKeySequence.Undo, self.undo_edit),
+                           (QKeySequence.Redo, self.redo_edit)):
+            shortcut = QShortcut(keys, self.table_view)
+            shortcut.setContext(Qt.WidgetWithChildrenShortcut)
+            shortcut.activated.connect(slot)
+
         layout = QVBoxLayout()
         layout.addWidget(self.table_view)
         layout.addLayout(button_layout)  
@@ -337,6 +911,17 @@ class MainWindow(QMainWindow):
         container.setLayout(layout)
         self.setCentralWidget(container)
 
+        # progression et annulation des tâches en arrière-plan
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(300)
+        self.progress_bar.hide()
+        self.cancel_button = QPushButton("Annuler")
+        self.cancel_button.setStyleSheet("padding: 2px 10px; font-size: 12px; margin: 0px;")
+        self.cancel_button.clicked.connect(self.cancel_tasks)
+        self.cancel_button.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_button)
+
         self.setStyleSheet("""
             QPushButton {
                 background-color: #1887f5;
@@ -387,15 +972,68 @@ class MainWindow(QMainWindow):
             }
         """)
 
+    def run_task(self, label, fn, *args, on_result=None, error_text=None, **kwargs):
+        # exécuter fn dans le pool de workers ; l'interface reste utilisable pendant ce temps
+        worker = start_worker(fn, *args, on_result=on_result, **kwargs)
+        worker.signals.progress.connect(lambda done, total: self.show_progress(label, done, total))
+        worker.signals.error.connect(lambda message: self.show_error_message(f"{error_text or label}\n{message}"))
+        worker.signals.finished.connect(lambda: self.task_finished(worker))
+        self.tasks[worker] = label
+        self.show_progress(label, 0, 0)
+        return worker
+
+    def show_progress(self, label, done, total):
+        # un total inconnu affiche une barre d'attente, avec le nombre de lignes traitées
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+        self.progress_bar.show()
+        self.cancel_button.show()
+        self.statusBar().showMessage(f"{label} : {done} lignes" if done else f"{label}...")
+
+    def task_finished(self, worker):
+        self.tasks.pop(worker, None)
+        if not self.tasks:
+            self.progress_bar.hide()
+            self.cancel_button.hide()
+            self.statusBar().clearMessage()
+
+    def cancel_tasks(self):
+        for worker in list(self.tasks):
+            worker.cancel()
+        self.statusBar().showMessage("Annulation en cours...")
+
     def load_file_dialog(self):
         options = QFileDialog.Options()
-        file, _ = QFileDialog.getOpenFileName(self, "Charger le fichier Excel", "", "Fichiers Excel (*.xls *.xlsx)", options=options)
-        if file:
-            extracted_df = self.file_handler.load_excel(file)
-            if extracted_df is not None:
-                self.update_table_view(extracted_df)
-            else:
-                self.show_error_message("Échec du chargement du fichier Excel. Vérifiez le format du fichier et les colonnes requises.")
+        files, _ = QFileDialog.getOpenFileNames(self, "Charger le fichier Excel", "", "Fichiers Excel (*.xls *.xlsx)", options=options)
+        if files:
+            self.load_files(files)
+
+    def load_files(self, files):
+        # un worker par fichier ; la table est mise à jour quand tous les fichiers sont traités
+        results = {}
+        pending = set(files)
+
+        def file_done(file):
+            pending.discard(file)
+            if not pending:
+                self.files_loaded(files, results)
+
+        for file in files:
+            name = os.path.basename(file)
+            worker = self.run_task(f"Chargement de {name}", self.file_handler.load_excel_batches, file,
+                                   on_result=lambda df, file=file: results.__setitem__(file, df),
+                                   error_text=f"Échec du chargement du fichier Excel {name}. "
+                                              "Vérifiez le format du fichier et les colonnes requises.")
+            worker.signals.finished.connect(lambda file=file: file_done(file))
+
+    def files_loaded(self, files, results):
+        # les fichiers en erreur ont déjà été signalés, les fichiers annulés n'ont pas de résultat
+        frames = [results[file] for file in files if results.get(file) is not None]
+        if not frames:
+            return
+        extracted_df = concat_extracted(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+        self.file_handler.df = extracted_df
+        self.update_table_view(extracted_df)
 
     def save_file_dialog(self):
         options = QFileDialog.Options()
@@ -403,18 +1041,37 @@ class MainWindow(QMainWindow):
         if file:
             model = self.table_view.model()
             if model is not None:
-                df = model.get_dataframe()
-                self.file_handler.save_excel(df, file)
+                # copie : la table reste modifiable pendant l'enregistrement
+                df = model.get_dataframe().copy()
+                self.run_task("Enregistrement", lambda progress, is_cancelled: self.file_handler.save_excel(df, file),
+                              on_result=self.file_saved)
+
+    def file_saved(self, saved):
+        if not saved:
+            self.show_error_message("Échec de l'enregistrement du fichier Excel.")
 
     def insert_data_to_db(self):
         model = self.table_view.model()
         if model is not None:
-            df = model.get_dataframe()
-            self.file_handler.insert_to_db(df)
+            df = model.get_dataframe().copy()
+            # [sync] delta=true : seules les journées postérieures à celles déjà en base sont envoyées
+            self.run_task("Insertion dans la bd", self.file_handler.insert_to_db, df, bulk=True,
+                          delta=db.flag('sync', 'delta'), on_result=self.data_inserted)
+
+    def data_inserted(self, counts):
+        if counts is None:
+            self.show_error_message("Échec de l'insertion dans la base de données.")
+            return
+        QMessageBox.information(self, "Insertion terminée",
+                                f"{counts['inserted']} lignes insérées, {counts['skipped']} ignorées, "
+                                f"{counts['failed']} en erreur.")
 
     def open_dashboard(self):
         # cacher la fenêtre principale
         self.hide()
+        # matplotlib, seaborn et mplcursors ne sont importés qu'à la première ouverture du tableau de bord
+        from dashboard import Dashboard
+        # le tableau de bord charge ses données dans un worker et s'affiche immédiatement
         dashboard = Dashboard()
         self.setCentralWidget(dashboard)
         # créer une instance de CourriersWidget
@@ -432,10 +1089,38 @@ class MainWindow(QMainWindow):
         self.table_view.setColumnWidth(5, 200)  # Travail Cumulée
         self.table_view.setColumnWidth(6, 845)  # Commentaire
 
+    def paste_cells(self):
+        # coller le presse-papiers à partir du coin de la sélection ; une valeur seule remplit la sélection
+        model = self.table_view.model()
+        if model is None:
+            return
+        indexes = self.table_view.selectionModel().selectedIndexes() or [self.table_view.currentIndex()]
+        indexes = [index for index in indexes if index.isValid()]
+        if not indexes:
+            return
+        top = min(index.row() for index in indexes)
+        left = min(index.column() for index in indexes)
+        rows = max(index.row() for index in indexes) - top + 1
+        columns = max(index.column() for index in indexes) - left + 1
+        if not model.paste(QApplication.clipboard().text(), top, left, rows, columns):
+            self.show_error_message("Collage impossible : les cellules doivent être modifiables (Date, Travail, "
+                                    "Commentaire) et les valeurs au bon format (yyyy-mm-dd, hh:mm).")
+
+    def undo_edit(self):
+        model = self.table_view.model()
+        if model is not None:
+            model.undo()
+
+    def redo_edit(self):
+        model = self.table_view.model()
+        if model is not None:
+            model.redo()
+
     def show_error_message(self, message):
         QMessageBox.critical(self, "Erreur", message)
 
 if __name__ == "__main__":
+    instrument.configure(db.settings('logging'))
     app = QApplication(sys.argv)
     main_window = MainWindow()
     main_window.showMaximized()
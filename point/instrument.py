@@ -0,0 +1,110 @@
+import atexit
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# étapes chronométrées : parse, transform, save, insert, query, aggregate, render
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s: %(message)s'
+
+_lock = threading.Lock()
+_spans = {}
+_counters = {}
+_metrics = None
+
+
+def get_logger(name):
+    return logging.getLogger(f'point.{name}')
+
+
+logger = get_logger('instrument')
+
+
+def configure(settings=None, level=None, log_file=None, metrics_file=None):
+    # appelée par les points d'entrée ; settings est la section [logging] de db.ini
+    global _metrics
+    settings = settings or {}
+    level = (level or settings.get('level') or 'INFO').upper()
+    log_file = log_file or settings.get('file') or None
+    metrics_file = metrics_file or settings.get('metrics') or None
+
+    root = logging.getLogger('point')
+    root.setLevel(level)
+    root.handlers.clear()
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    root.addHandler(console)
+    if log_file:
+        handler = logging.FileHandler(log_file, encoding='utf-8')
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+
+    with _lock:
+        if _metrics is not None:
+            _metrics.close()
+        # une ligne JSON par étape chronométrée, puis un résumé à la fermeture du programme
+        _metrics = open(metrics_file, 'a', encoding='utf-8') if metrics_file else None
+
+
+def record(stage, seconds, **fields):
+    with _lock:
+        stats = _spans.setdefault(stage, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stats['count'] += 1
+        stats['seconds'] += seconds
+        stats['max_seconds'] = max(stats['max_seconds'], seconds)
+        if _metrics is not None:
+            _metrics.write(json.dumps({'time': time.time(), 'stage': stage, 'seconds': round(seconds, 6), **fields},
+                                      default=str) + '\n')
+            _metrics.flush()
+    logger.debug("%s took %.4f s %s", stage, seconds, fields)
+
+
+@contextmanager
+def span(stage, **fields):
+    # le bloc peut compléter fields (nombre de lignes, etc.) avant l'enregistrement
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        record(stage, time.perf_counter() - start, **fields)
+
+
+def timed_iter(stage, iterable, **fields):
+    # chronométrer la production de chaque lot d'un générateur (lecture d'un fichier, etc.)
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        record(stage, time.perf_counter() - start, rows=len(item), **fields)
+        yield item
+
+
+def count(name, n=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def snapshot():
+    with _lock:
+        return {'spans': {stage: dict(stats) for stage, stats in _spans.items()}, 'counters': dict(_counters)}
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+
+@atexit.register
+def _write_summary():
+    with _lock:
+        metrics = _metrics
+    if metrics is not None and not metrics.closed:
+        summary = snapshot()
+        with _lock:
+            metrics.write(json.dumps({'time': time.time(), 'summary': summary}) + '\n')
+            metrics.close()
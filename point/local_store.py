@@ -0,0 +1,169 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+import db
+import instrument
+
+logger = instrument.get_logger('local_store')
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.local', 'share', 'point', 'point.sqlite3')
+
+# même contenu que dbbi dans PostgreSQL ; les dates sont en texte AAAA-MM-JJ (ordre chronologique)
+# et les durées en secondes, pour que SQLite les agrège directement
+TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY,
+        nom TEXT,
+        date TEXT,
+        travail REAL,
+        travail_cumule REAL,
+        UNIQUE (nom, date)
+    );
+    CREATE INDEX IF NOT EXISTS {table}_date_idx ON {table} (date, nom, travail);
+"""
+
+# filtres des graphiques ; mois (AAAA-MM) et noms sont passés en tableaux JSON, NULL désactive le filtre ;
+# :first et :last bornent les dates aux mois choisis (toutes les dates sans filtre) : une condition sans OR
+# laisse SQLite ne parcourir que cette plage de l'index sur date
+PANEL_FILTER = """
+    nom IS NOT NULL AND date >= :first AND date < :last
+    AND (:months IS NULL OR substr(date, 1, 7) IN (SELECT value FROM json_each(:months)))
+    AND (:names IS NULL OR nom IN (SELECT value FROM json_each(:names)))
+"""
+
+# mêmes résultats que les requêtes PostgreSQL sur les agrégats (aggregates.PANEL_QUERIES), calculés sur la
+# table brute : AVG ignore les absences comme SUM(travail) / SUM(jours_travail) ; travail est en heures
+PANEL_QUERIES = {
+    'summary': f"""
+        SELECT COUNT(*), AVG(travail) / 3600, MIN(date), MAX(date)
+        FROM {{table}} WHERE {PANEL_FILTER}
+    """,
+    'weekday': f"""
+        SELECT CAST(strftime('%w', date) AS INTEGER) AS jour_semaine, AVG(travail) / 3600
+        FROM {{table}}
+        WHERE jour_semaine BETWEEN 1 AND 5 AND {PANEL_FILTER}
+        GROUP BY jour_semaine
+    """,
+    'daily': f"""
+        SELECT date, AVG(travail) / 3600
+        FROM {{table}} WHERE {PANEL_FILTER}
+        GROUP BY date ORDER BY date
+    """,
+    'monthly': f"""
+        SELECT substr(date, 1, 7) || '-01' AS mois, AVG(travail) / 3600
+        FROM {{table}} WHERE {PANEL_FILTER}
+        GROUP BY mois ORDER BY mois
+    """,
+    'employee_totals': f"""
+        SELECT nom, COALESCE(SUM(travail), 0) / 3600
+        FROM {{table}} WHERE {PANEL_FILTER}
+        GROUP BY nom ORDER BY nom
+    """,
+}
+
+
+def seconds(value):
+    return value.total_seconds() if value is not None else None
+
+
+class LocalStore:
+    # stockage embarqué dans un fichier SQLite : insertion, lecture et agrégats des graphiques
+    # sans serveur, dans le processus ; une connexion par opération, le mode WAL laisse le tableau de bord
+    # lire pendant qu'un import écrit
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.ready = set()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings):
+        # settings est la section [storage] de db.ini
+        return cls(os.path.expanduser(settings.get('path') or DEFAULT_PATH))
+
+    @contextmanager
+    def connection(self, table='dbbi'):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            self.ensure_schema(conn, table)
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def ensure_schema(self, conn, table):
+        # une fois par fichier et par table
+        with self.lock:
+            if (self.path, table) in self.ready:
+                return
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(TABLE_DDL.format(table=table))
+            self.ready.add((self.path, table))
+
+    def read_frame(self, table='dbbi'):
+        # même forme que SELECT * FROM dbbi dans PostgreSQL : dates et durées typées
+        with self.connection(table) as conn:
+            df = pd.read_sql_query(f"SELECT * FROM {table} ORDER BY id", conn)
+        df['date'] = pd.to_datetime(df['date']).dt.date
+        for column in ('travail', 'travail_cumule'):
+            df[column] = pd.to_timedelta(df[column], unit='s')
+        return df
+
+    def insert_rows(self, conn, rows, table='dbbi', batch_size=1000, progress=None, is_cancelled=None):
+        # rows : tuples (nom, date, travail, travail_cumule) de ExcelFileHandler.rows_for_db ;
+        # une ligne (nom, date) déjà présente est ignorée, chaque lot est validé séparément
+        counts = {'inserted': 0, 'skipped': 0, 'failed': 0}
+        insert_query = (f"INSERT OR IGNORE INTO {table} (nom, date, travail, travail_cumule) "
+                        f"VALUES (?, ?, ?, ?)")
+        for start in range(0, len(rows), batch_size):
+            # les lots déjà validés restent en base si l'utilisateur annule
+            if is_cancelled is not None and is_cancelled():
+                logger.info("Local insert cancelled after %d rows.", start)
+                break
+            batch = [(nom, date.isoformat(), seconds(travail), seconds(travail_cumule))
+                     for nom, date, travail, travail_cumule in rows[start:start + batch_size]]
+            cursor = conn.executemany(insert_query, batch)
+            conn.commit()
+            counts['inserted'] += cursor.rowcount
+            counts['skipped'] += len(batch) - cursor.rowcount
+            if progress is not None:
+                progress(start + len(batch), len(rows))
+        return counts
+
+    def high_water_marks(self, conn, table='dbbi'):
+        # dernière date enregistrée pour chaque employé, comme schema.high_water_marks
+        cursor = conn.execute(f"SELECT nom, MAX(date) FROM {table} WHERE nom IS NOT NULL GROUP BY nom")
+        return {nom: pd.Timestamp(date).date() for nom, date in cursor.fetchall() if date is not None}
+
+    def panel_rows(self, months=None, names=None, table='dbbi'):
+        # lignes brutes des requêtes des graphiques, dans le format de aggregates.query_panels
+        params = {'months': json.dumps(list(months)) if months is not None else None,
+                  'names': json.dumps(list(names)) if names is not None else None,
+                  # « AAAA-MM-32 » suit toutes les dates du dernier mois dans l'ordre du texte
+                  'first': f"{min(months)}-01" if months else '0000-01-01',
+                  'last': f"{max(months)}-32" if months else '9999-12-32'}
+        with self.connection(table) as conn:
+            return {panel: conn.execute(query.format(table=table), params).fetchall()
+                    for panel, query in PANEL_QUERIES.items()}
+
+    def names(self, table='dbbi'):
+        with self.connection(table) as conn:
+            return [row[0] for row in conn.execute(f"SELECT DISTINCT nom FROM {table} WHERE nom IS NOT NULL")]
+
+    def months(self, table='dbbi'):
+        with self.connection(table) as conn:
+            return [row[0] for row in conn.execute(
+                f"SELECT DISTINCT substr(date, 1, 7) AS mois FROM {table} WHERE date IS NOT NULL ORDER BY mois")]
+
+
+local_store = LocalStore.from_settings(db.settings('storage'))
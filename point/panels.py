@@ -0,0 +1,371 @@
+import mplcursors
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.dates import DateFormatter, date2num
+from matplotlib.transforms import Bbox
+
+import instrument
+from aggregates import WEEKDAYS_FR
+
+EXPECTED_HOURS_PER_WEEK = 40
+THRESHOLD_HOURS = 8
+# écart minimal en pixels entre deux points de la série journalière pour afficher leurs marqueurs
+MARKER_SPACING = 8
+
+
+def same_input(old, new):
+    if old is None:
+        return False
+    if isinstance(new, (pd.Series, pd.DataFrame)):
+        return old.equals(new)
+    return np.array_equal(old, new, equal_nan=True)
+
+
+def minmax_decimate(x, y, buckets):
+    # au plus deux points (min et max) par tranche de points consécutifs, dans l'ordre d'origine :
+    # les pics restent visibles et la courbe tracée ne dépasse pas la résolution de l'écran
+    n = len(y)
+    if n <= 2 * buckets:
+        return x, y
+    size = -(-n // buckets)
+    padding = -n % size
+    offsets = np.arange(0, n + padding, size)
+    lows = np.concatenate([y, np.full(padding, np.inf)]).reshape(-1, size).argmin(axis=1) + offsets
+    highs = np.concatenate([y, np.full(padding, -np.inf)]).reshape(-1, size).argmax(axis=1) + offsets
+    # premier et dernier points gardés pour conserver l'étendue de la série
+    keep = np.unique(np.concatenate([[0, n - 1], lows, highs]))
+    return x[keep], y[keep]
+
+
+class PanelRenderer:
+    # dessine les six graphiques du tableau de bord ; les artistes sont créés une seule fois,
+    # ensuite seules leurs données changent et seuls les graphiques modifiés sont redessinés ;
+    # interactive=False (rapports) : ni infobulles ni dessin, la figure est dessinée par savefig
+    def __init__(self, figure, axes, interactive=True):
+        self.figure = figure
+        self.interactive = interactive
+        self.canvas = figure.canvas
+        self.axes = {
+            'employees': axes[0, 0],
+            'ratio': axes[0, 1],
+            'weekday': axes[1, 0],
+            'daily': axes[1, 1],
+            'monthly': axes[2, 0],
+            'work_days': axes[2, 1],
+        }
+        self.artists = {name: [] for name in self.axes}
+        self.inputs = {}
+        self.cursors = {}
+        # fond de la figure sans aucun graphique, capturé au dernier dessin complet
+        self.blank = None
+        self.blank_size = None
+        self.showing_message = False
+        self.build()
+
+    def build(self):
+        ax = self.axes['employees']
+        self.most_worked = ax.text(0.5, 0.6, '', horizontalalignment='center', verticalalignment='center',
+                                   transform=ax.transAxes, fontsize=12, color='green')
+        self.least_worked = ax.text(0.5, 0.4, '', horizontalalignment='center', verticalalignment='center',
+                                    transform=ax.transAxes, fontsize=12, color='red')
+        ax.set_title('Employés Travaillés')
+        ax.axis('off')
+        self.artists['employees'] = [self.most_worked, self.least_worked]
+
+        # graphique en anneau : heures réelles par rapport aux heures prévues
+        ax = self.axes['ratio']
+        self.wedges, self.wedge_labels, self.wedge_pcts = ax.pie(
+            [1, 1],
+            labels=['Heures Réelles', 'Heures Attendues'],
+            autopct='%1.1f%%',
+            startangle=90,
+            colors=['#1887f5', '#fa0707'],
+            wedgeprops=dict(width=0.3)
+        )
+        self.artists['ratio'] = [*self.wedges, *self.wedge_labels, *self.wedge_pcts]
+
+        ax = self.axes['weekday']
+        self.weekday_bars = list(ax.bar(range(len(WEEKDAYS_FR)), np.zeros(len(WEEKDAYS_FR))))
+        ax.set_xticks(range(len(WEEKDAYS_FR)), WEEKDAYS_FR)
+        ax.set_xlabel('Jour de la Semaine')
+        ax.set_ylabel('Moyenne Travail (heures)')
+        ax.set_title('Moyenne Travail par Jour de la Semaine')
+        self.artists['weekday'] = self.weekday_bars
+        self.cursors['weekday'] = self.bar_cursor(self.weekday_bars, lambda i: (
+            f"{WEEKDAYS_FR[i]}: {self.inputs['weekday'].iloc[i]:.1f} heures"))
+
+        ax = self.axes['daily']
+        ax.xaxis_date()
+        self.daily_line, = ax.plot([], [], marker='o', color='blue')
+        self.daily_max, = ax.plot([], [], 'go', markersize=10)
+        self.daily_min, = ax.plot([], [], 'ro', markersize=10)
+        self.threshold_line = ax.axhline(y=THRESHOLD_HOURS, color='red', linestyle='--', label='Seuil de 8 heures')
+        self.mean_line = ax.axhline(y=0, color='orange', linestyle='--', label='Moyenne Travail')
+        ax.set_xlabel('Date')
+        ax.set_ylabel('Travail (heures)')
+        ax.set_title('Travail au Fil du Temps')
+        ax.xaxis.set_major_formatter(DateFormatter('%d-%m-%Y'))
+        self.artists['daily'] = [self.daily_line, self.daily_max, self.daily_min, self.threshold_line, self.mean_line]
+        # série complète (dates en nombres matplotlib) ; seule sa partie visible, réduite, est tracée
+        self.daily_x = np.array([])
+        self.daily_y = np.array([])
+        # zoom ou déplacement avec la barre d'outils : recalculer le détail de la fenêtre visible
+        ax.callbacks.connect('xlim_changed', lambda ax: self.refine_daily())
+
+        # le nombre de mois varie d'un filtre à l'autre : les barres sont ajoutées au besoin et masquées sinon
+        ax = self.axes['monthly']
+        self.monthly_bars = []
+        ax.set_xlabel('Mois')
+        ax.set_ylabel('Moyenne Travail (heures)')
+        ax.set_title('Moyenne Travail par Mois')
+
+        ax = self.axes['work_days']
+        ax.xaxis_date()
+        self.work_days_line, = ax.plot([], [], marker='o', color='blue')
+        self.work_days_max, = ax.plot([], [], 'go', markersize=10, label='Max Jours de Travail')
+        self.work_days_min, = ax.plot([], [], 'ro', markersize=10, label='Min Jours de Travail')
+        ax.set_xlabel('Mois')
+        ax.set_ylabel('Nombre de Jours de Travail')
+        ax.set_title('Nombre de Jours de Travail par Mois')
+        self.artists['work_days'] = [self.work_days_line, self.work_days_max, self.work_days_min]
+
+        self.messages = {name: ax.text(0.5, 0.5, '', horizontalalignment='center', verticalalignment='center',
+                                       transform=ax.transAxes, fontsize=12, visible=False)
+                         for name, ax in self.axes.items()}
+        self.axis_on = {name: ax.axison for name, ax in self.axes.items()}
+        self.figure.subplots_adjust(wspace=0.5, hspace=0.5)
+
+    def bar_cursor(self, bars, text):
+        # une seule infobulle par graphique ; le texte est lu dans les données courantes au survol
+        if not self.interactive:
+            return None
+        cursor = mplcursors.cursor(bars, hover=True)
+        cursor.connect("add", lambda sel: sel.annotation.set_text(text(bars.index(sel.artist))))
+        return cursor
+
+    def panel_inputs(self, panels):
+        # données d'entrée de chaque graphique, comparées au tracé précédent pour savoir quoi redessiner
+        days = len(pd.date_range(start=panels['start'], end=panels['end'], freq='D'))
+        weeks = len(pd.date_range(start=panels['start'], end=panels['end'], freq='W'))
+        actual_hours = max(0, panels['mean'] * days / 7)
+        expected_hours = max(0, EXPECTED_HOURS_PER_WEEK * weeks)
+        monthly = panels['monthly']['travail']
+        return {
+            'employees': panels['employee_totals'],
+            'ratio': (actual_hours, expected_hours),
+            'weekday': panels['weekday'],
+            'daily': panels['daily'],
+            'monthly': monthly,
+            'work_days': monthly / 8,  # convertir les heures en jours
+        }
+
+    def update(self, panels):
+        if panels is None:
+            self.show_message('Aucune donnée disponible pour le graphique')
+            return
+
+        inputs = self.panel_inputs(panels)
+        changed = [name for name, data in inputs.items()
+                   if self.showing_message or not same_input(self.inputs.get(name), data)]
+        if not changed:
+            return
+
+        with instrument.span('render', panels=len(changed)):
+            for name in changed:
+                self.inputs[name] = inputs[name]
+                getattr(self, f'update_{name}')(inputs[name])
+
+            if not self.interactive:
+                self.hide_message()
+            elif self.showing_message or not self.can_blit():
+                self.hide_message()
+                self.full_draw()
+            else:
+                self.blit_panels(changed)
+
+    def update_employees(self, employee_totals):
+        if employee_totals.empty:
+            self.most_worked.set_text('')
+            self.least_worked.set_text('')
+        else:
+            self.most_worked.set_text(f"Employé le Plus Travaillé: {employee_totals.idxmax()}")
+            self.least_worked.set_text(f"Employé le Moins Travaillé: {employee_totals.idxmin()}")
+        for artist in self.artists['employees']:
+            artist.set_visible(True)
+
+    def update_ratio(self, hours):
+        actual_hours, expected_hours = hours
+        sizes = np.array([actual_hours, max(0, expected_hours - actual_hours)])
+        visible = expected_hours > 0 and sizes.sum() > 0
+        for artist in self.artists['ratio']:
+            artist.set_visible(visible)
+        if not visible:
+            return
+
+        # même géométrie qu'Axes.pie : départ à 90°, étiquettes à 1.1 et pourcentages à 0.6 du rayon
+        theta1 = 90
+        for wedge, label, pct, fraction in zip(self.wedges, self.wedge_labels, self.wedge_pcts, sizes / sizes.sum()):
+            theta2 = theta1 + 360 * fraction
+            wedge.set_theta1(theta1)
+            wedge.set_theta2(theta2)
+            angle = np.deg2rad((theta1 + theta2) / 2)
+            x, y = np.cos(angle), np.sin(angle)
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text(f'{fraction * 100:.1f}%')
+            theta1 = theta2
+
+    def set_bars(self, ax, bars, values):
+        # hauteurs et couleurs comme sns.barplot(palette='Blues_d'), max en vert et min en rouge
+        heights = np.nan_to_num(np.asarray(values, dtype=float))
+        colors = sns.color_palette('Blues_d', len(heights))
+        for i, (bar, height) in enumerate(zip(bars, heights)):
+            bar.set_x(i - 0.4)
+            bar.set_width(0.8)
+            bar.set_height(height)
+            bar.set_facecolor(colors[i])
+            bar.set_visible(True)
+        for bar in bars[len(heights):]:
+            bar.set_visible(False)
+        if len(heights) > 0:
+            bars[int(heights.argmax())].set_facecolor('green')
+            bars[int(heights.argmin())].set_facecolor('red')
+        ax.set_xlim(-0.5, max(len(heights), 1) - 0.5)
+        ax.set_ylim(0, max(heights.max(initial=0), 1) * 1.05)
+
+    def update_weekday(self, weekday):
+        self.set_bars(self.axes['weekday'], self.weekday_bars, weekday.to_numpy())
+
+    def update_monthly(self, monthly):
+        ax = self.axes['monthly']
+        if len(monthly) > len(self.monthly_bars):
+            missing = len(monthly) - len(self.monthly_bars)
+            self.monthly_bars.extend(ax.bar(range(len(self.monthly_bars), len(monthly)), np.zeros(missing)))
+            self.artists['monthly'] = self.monthly_bars
+            # la liste des barres a changé : remplacer l'infobulle au lieu d'en empiler une nouvelle
+            if self.cursors.get('monthly') is not None:
+                self.cursors['monthly'].remove()
+            self.cursors['monthly'] = self.bar_cursor(self.monthly_bars, lambda i: (
+                f"{self.inputs['monthly'].index[i].strftime('%Y-%m')}: {self.inputs['monthly'].iloc[i]:.1f} heures"))
+        self.set_bars(ax, self.monthly_bars, monthly.to_numpy())
+        ax.set_xticks(range(len(monthly)), monthly.index.strftime('%Y-%m'))
+
+    def set_line(self, line, max_marker, min_marker, x, y):
+        line.set_data(x, y)
+        if len(y) > 0 and not np.all(np.isnan(y)):
+            max_marker.set_data([x[np.nanargmax(y)]], [np.nanmax(y)])
+            min_marker.set_data([x[np.nanargmin(y)]], [np.nanmin(y)])
+        else:
+            max_marker.set_data([], [])
+            min_marker.set_data([], [])
+
+    def update_daily(self, daily):
+        # min, max et moyenne sur la série complète ; la courbe est réduite à la largeur du graphique
+        self.daily_x = date2num(daily['date'].to_numpy())
+        self.daily_y = daily['travail'].to_numpy(dtype=float)
+        self.set_line(self.daily_line, self.daily_max, self.daily_min, self.daily_x, self.daily_y)
+        self.mean_line.set_ydata([np.nanmean(self.daily_y) if len(self.daily_y) else 0] * 2)
+        self.refine_daily(self.daily_x[[0, -1]] if len(self.daily_x) else None)
+        for artist in self.artists['daily']:
+            artist.set_visible(True)
+        # la courbe réduite garde les extrêmes : les limites calculées sont celles de la série complète
+        self.rescale(self.axes['daily'])
+
+    def refine_daily(self, window=None):
+        # tracer les points de la fenêtre visible (plus un de chaque côté pour que la courbe rejoigne les bords),
+        # au plus deux par pixel ; les marqueurs ne sont affichés que si les points sont assez espacés
+        ax = self.axes['daily']
+        x, y = self.daily_x, self.daily_y
+        start, end = window if window is not None else ax.get_xlim()
+        first = max(np.searchsorted(x, start, side='left') - 1, 0)
+        last = min(np.searchsorted(x, end, side='right') + 1, len(x))
+        pixels = max(int(ax.bbox.width), 1)
+        x, y = minmax_decimate(x[first:last], y[first:last], pixels)
+        self.daily_line.set_data(x, y)
+        self.daily_line.set_marker('o' if len(x) * MARKER_SPACING <= pixels else 'None')
+
+    def update_work_days(self, days_of_travail):
+        x = days_of_travail.index.to_numpy()
+        y = days_of_travail.to_numpy(dtype=float)
+        self.set_line(self.work_days_line, self.work_days_max, self.work_days_min, x, y)
+        for artist in self.artists['work_days']:
+            artist.set_visible(True)
+        self.rescale(self.axes['work_days'])
+
+    def rescale(self, ax):
+        # nouvelles données : un zoom ou un déplacement de la barre d'outils coupe l'ajustement automatique,
+        # qui est réactivé ; les vues enregistrées (retour, accueil) portaient sur les anciennes données
+        ax.set_autoscale_on(True)
+        ax.relim(visible_only=True)
+        ax.autoscale_view()
+        toolbar = getattr(self.canvas, 'toolbar', None)
+        if toolbar is not None:
+            toolbar.update()
+
+    def show_message(self, message, color='red'):
+        # masquer les graphiques et afficher le même message sur chacun
+        for name, ax in self.axes.items():
+            for artist in self.artists[name]:
+                artist.set_visible(False)
+            ax.set_axis_off()
+            self.messages[name].set_text(message)
+            self.messages[name].set_color(color)
+            self.messages[name].set_visible(True)
+        self.showing_message = True
+        self.inputs.clear()
+        if self.interactive:
+            self.full_draw()
+
+    def hide_message(self):
+        for name, ax in self.axes.items():
+            self.messages[name].set_visible(False)
+            if self.axis_on[name]:
+                ax.set_axis_on()
+        self.showing_message = False
+
+    def can_blit(self):
+        return (self.canvas.supports_blit and self.blank is not None
+                and self.blank_size == self.canvas.get_width_height())
+
+    def full_draw(self):
+        # dessiner une fois la figure sans axes pour garder son fond, puis la figure complète
+        if self.canvas.supports_blit:
+            for ax in self.axes.values():
+                ax.set_visible(False)
+            self.canvas.draw()
+            self.blank = self.canvas.copy_from_bbox(self.figure.bbox)
+            self.blank_size = self.canvas.get_width_height()
+            for ax in self.axes.values():
+                ax.set_visible(True)
+        self.canvas.draw()
+
+    def slot(self, name):
+        # case de la grille réservée au graphique : jusqu'au milieu de l'espace qui le sépare de ses voisins,
+        # ou jusqu'au bord de la figure ; titres et graduations y tiennent avec wspace/hspace=0.5
+        spec = self.axes[name].get_subplotspec()
+        rows, cols = spec.get_gridspec().get_geometry()
+        bottoms, tops, lefts, rights = spec.get_gridspec().get_grid_positions(self.figure)
+        row, col = spec.rowspan.start, spec.colspan.start
+        x0 = 0 if col == 0 else (rights[col - 1] + lefts[col]) / 2
+        x1 = 1 if col == cols - 1 else (rights[col] + lefts[col + 1]) / 2
+        y1 = 1 if row == 0 else (bottoms[row - 1] + tops[row]) / 2
+        y0 = 0 if row == rows - 1 else (bottoms[row] + tops[row + 1]) / 2
+        width, height = self.canvas.get_width_height(physical=True)
+        return Bbox([[round(x0 * width), round(y0 * height)], [round(x1 * width), round(y1 * height)]])
+
+    def blit_panels(self, changed):
+        # quand tout change, un seul dessin complet coûte moins que six blits
+        if len(changed) == len(self.axes):
+            self.canvas.draw()
+            return
+        height = self.canvas.get_width_height(physical=True)[1]
+        for name in changed:
+            region = self.slot(name)
+            # restore_region compte les y depuis le haut de l'image, les boîtes matplotlib depuis le bas ;
+            # xy=(0, 0) garde le fond capturé sur toute la figure à sa place
+            x0, y0, x1, y1 = region.extents
+            self.canvas.restore_region(self.blank, bbox=(x0, height - y1, x1, height - y0), xy=(0, 0))
+            self.figure.draw_artist(self.axes[name])
+            self.canvas.blit(region)
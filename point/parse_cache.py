@@ -0,0 +1,139 @@
+import hashlib
+import importlib.util
+import os
+import threading
+import uuid
+
+import db
+import instrument
+
+logger = instrument.get_logger('parse_cache')
+
+# à incrémenter à chaque changement du résultat de process_frame : les anciennes entrées ne sont plus lues
+PROCESSING_VERSION = 2
+
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'point', 'parse')
+
+
+class ParseCache:
+    # cache disque des tableaux traités, au format Feather (Arrow) non compressé : le fichier est lu par mmap,
+    # sans décompression, puis converti en DataFrame (les colonnes sont copiées en mémoire par to_pandas) ;
+    # la clé est le contenu du fichier, pas son nom : un export renommé ou copié est retrouvé
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=512 * 1024 * 1024, enabled=True):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # pyarrow est facultatif : sans lui le cache est désactivé et chaque fichier est relu
+        self.enabled = enabled and importlib.util.find_spec('pyarrow') is not None
+        if enabled and not self.enabled:
+            logger.info("pyarrow is not installed, parse cache disabled")
+        # empreintes déjà calculées, par (chemin, taille, date de modification)
+        self.digests = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, settings, enabled=True):
+        # settings est la section [parse_cache] de db.ini
+        return cls(directory=os.path.expanduser(settings.get('directory') or DEFAULT_DIRECTORY),
+                   max_bytes=int(float(settings.get('max_size_mb', 512)) * 1024 * 1024),
+                   enabled=enabled)
+
+    def file_digest(self, file_path):
+        stat = os.stat(file_path)
+        stamp = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            if stamp in self.digests:
+                return self.digests[stamp]
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        with self.lock:
+            self.digests[stamp] = digest.hexdigest()
+            return self.digests[stamp]
+
+    def key(self, file_path, per_employee=False):
+        # le cumul dépend du regroupement par employé, il fait donc partie de la clé
+        if not self.enabled:
+            return None
+        return f"{self.file_digest(file_path)}-v{PROCESSING_VERSION}-{'e' if per_employee else 'f'}"
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.feather")
+
+    def load(self, key):
+        # None si l'entrée est absente ou illisible ; une entrée lue redevient la plus récente ;
+        # le DataFrame renvoyé est une copie en mémoire, il ne dépend plus du fichier
+        if key is None:
+            return None
+        path = self.path(key)
+        try:
+            from pyarrow import feather
+            df = feather.read_table(path, memory_map=True).to_pandas()
+        except FileNotFoundError:
+            instrument.count('parse_cache.miss')
+            return None
+        except Exception as e:
+            logger.warning("Unreadable parse cache entry %s, ignoring it: %s", path, e)
+            instrument.count('parse_cache.miss')
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        instrument.count('parse_cache.hit')
+        logger.debug("Parse cache hit: %s", path)
+        return df
+
+    def store(self, key, df):
+        # écriture dans un fichier temporaire puis renommage : un lecteur ne voit jamais une entrée partielle
+        if key is None:
+            return
+        path = self.path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            from pyarrow import feather
+            os.makedirs(self.directory, exist_ok=True)
+            feather.write_feather(df.reset_index(drop=True), tmp_path, compression='uncompressed')
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Unable to write parse cache entry %s: %s", path, e)
+            self.remove(tmp_path)
+            return
+        instrument.count('parse_cache.store')
+        self.evict()
+
+    def evict(self):
+        # supprimer les entrées les moins récemment utilisées tant que la taille totale dépasse la limite
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.is_file() and entry.name.endswith('.feather')]
+        except OSError:
+            return
+        entries = sorted(((entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in entries))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if self.remove(path):
+                total -= size
+                instrument.count('parse_cache.evicted')
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def clear(self):
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.endswith('.feather'):
+                self.remove(entry.path)
+
+
+parse_cache = ParseCache.from_settings(db.settings('parse_cache'), db.flag('parse_cache', 'enabled', True))
@@ -0,0 +1,118 @@
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+import aggregates
+import db
+import instrument
+
+FORMATS = ('pdf', 'png')
+
+# état de chaque processus du pool : une figure et ses graphiques, réutilisés d'un rapport à l'autre
+_renderer = None
+
+
+def load_frame():
+    # une seule lecture de dbbi pour tous les rapports
+    with instrument.span('query', table='dbbi') as fields:
+        df = aggregates.read_dbbi()
+        fields['rows'] = len(df)
+    return aggregates.prepare_frame(df)
+
+
+def report_jobs(df, months=None, names=None):
+    # un rapport par (employé, mois calendaire) présent dans les données, avec ses seules lignes
+    df = df[df['nom'].notna() & df['date'].notna()]
+    if df.empty:
+        return []
+    keys = pd.DataFrame({'nom': df['nom'].str.strip(), 'month': df['date'].dt.to_period('M').astype(str)})
+    if months:
+        df, keys = df[keys['month'].isin(months)], keys[keys['month'].isin(months)]
+    if names:
+        df, keys = df[keys['nom'].isin(names)], keys[keys['nom'].isin(names)]
+    return [(name, month, rows) for (name, month), rows in df.groupby([keys['nom'], keys['month']], sort=True)]
+
+
+def report_path(output_dir, name, month, fmt):
+    # un répertoire par mois, un fichier par employé ; le nom est nettoyé pour le système de fichiers
+    safe_name = re.sub(r'[^\w.-]+', '_', name).strip('_') or 'sans_nom'
+    return os.path.join(output_dir, month, f"{safe_name}.{fmt}")
+
+
+def init_worker(settings):
+    # backend Agg et figure autonome : aucun affichage nécessaire
+    global _renderer
+    instrument.configure(settings)
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from panels import PanelRenderer
+    figure = Figure(figsize=(12, 18))
+    FigureCanvasAgg(figure)
+    _renderer = PanelRenderer(figure, figure.subplots(3, 2), interactive=False)
+
+
+def render_report(job, output_dir, fmt='pdf', dpi=100):
+    # exécutée dans un processus du pool ; les erreurs sont renvoyées dans le résultat
+    name, month, rows = job
+    path = report_path(output_dir, name, month, fmt)
+    start = time.perf_counter()
+    try:
+        _renderer.update(aggregates.compute_panels(rows))
+        _renderer.figure.suptitle(f"{name} - {month}", fontsize=16)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with instrument.span('save', file=path):
+            _renderer.figure.savefig(path, format=fmt, dpi=dpi)
+    except Exception as e:
+        return {'name': name, 'month': month, 'file': path, 'rows': len(rows), 'seconds': time.perf_counter() - start,
+                'error': f"{type(e).__name__}: {e}"}
+    return {'name': name, 'month': month, 'file': path, 'rows': len(rows), 'seconds': time.perf_counter() - start,
+            'error': None}
+
+
+def run_reports(df, output_dir, months=None, names=None, fmt='pdf', dpi=100, workers=None, report=print):
+    jobs = report_jobs(df, months, names)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    results = []
+    if jobs:
+        # lots de rapports par processus : moins d'allers-retours, la figure de chaque processus est réutilisée
+        chunksize = max(1, len(jobs) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=init_worker,
+                                 initargs=(db.settings('logging'),)) as pool:
+            for result in pool.map(render_report, jobs, [output_dir] * len(jobs), [fmt] * len(jobs),
+                                   [dpi] * len(jobs), chunksize=chunksize):
+                results.append(result)
+                if result['error'] is not None:
+                    report(f"ERREUR {result['name']} {result['month']}: {result['error']}")
+    elapsed = time.perf_counter() - start
+    failed = sum(result['error'] is not None for result in results)
+    rate = len(results) / elapsed if elapsed else 0
+    report(f"{len(results)} rapports ({failed} en erreur) dans {output_dir} en {elapsed:.1f} s "
+           f"avec {workers} processus ({rate:.1f} rapports/s)")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rapports mensuels par employé (graphiques du tableau de bord)")
+    parser.add_argument('--output-dir', required=True, help="répertoire des rapports (un sous-répertoire par mois)")
+    parser.add_argument('--month', action='append', help="mois AAAA-MM, répétable (défaut : tous)")
+    parser.add_argument('--name', action='append', help="employé, répétable (défaut : tous)")
+    parser.add_argument('--format', choices=FORMATS, default='pdf')
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--workers', type=int, default=None, help="nombre de processus (défaut : nombre de cœurs)")
+    args = parser.parse_args(argv)
+
+    instrument.configure(db.settings('logging'))
+    results = run_reports(load_frame(), args.output_dir, months=args.month, names=args.name, fmt=args.format,
+                          dpi=args.dpi, workers=args.workers)
+    if any(result['error'] is not None for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+import argparse
+import datetime
+import threading
+
+import psycopg2
+
+import db
+
+# heures travaillées d'une ligne de dbbi (NULL pour les absences)
+HOURS = "EXTRACT(EPOCH FROM CAST(travail AS interval))::float8 / 3600"
+
+# agrégats par (employé, jour) et par (employé, mois, jour de la semaine) ;
+# lignes compte toutes les lignes, jours_travail seulement celles dont le travail est renseigné
+ROLLUP_DDL = """
+    CREATE TABLE {table}_daily (
+        nom varchar(100) NOT NULL,
+        date date NOT NULL,
+        lignes integer NOT NULL,
+        jours_travail integer NOT NULL,
+        travail float8 NOT NULL,
+        PRIMARY KEY (nom, date)
+    );
+    CREATE TABLE {table}_monthly (
+        nom varchar(100) NOT NULL,
+        mois date NOT NULL,
+        jour_semaine smallint NOT NULL,
+        lignes integer NOT NULL,
+        jours_travail integer NOT NULL,
+        travail float8 NOT NULL,
+        premiere_date date NOT NULL,
+        derniere_date date NOT NULL,
+        PRIMARY KEY (nom, mois, jour_semaine)
+    );
+"""
+
+# {source} : relation (nom, date, travail), soit la table entière soit les lignes tout juste insérées
+DAILY_UPSERT = """
+    INSERT INTO {table}_daily AS r (nom, date, lignes, jours_travail, travail)
+    SELECT nom, date, COUNT(*), COUNT(travail), COALESCE(SUM({hours}), 0)
+    FROM {source}
+    WHERE nom IS NOT NULL AND date IS NOT NULL
+    GROUP BY nom, date
+    ON CONFLICT (nom, date) DO UPDATE SET
+        lignes = r.lignes + EXCLUDED.lignes,
+        jours_travail = r.jours_travail + EXCLUDED.jours_travail,
+        travail = r.travail + EXCLUDED.travail
+"""
+
+MONTHLY_UPSERT = """
+    INSERT INTO {table}_monthly AS r (nom, mois, jour_semaine, lignes, jours_travail, travail,
+                                      premiere_date, derniere_date)
+    SELECT nom, date_trunc('month', date)::date, EXTRACT(ISODOW FROM date)::smallint,
+           COUNT(*), COUNT(travail), COALESCE(SUM({hours}), 0), MIN(date), MAX(date)
+    FROM {source}
+    WHERE nom IS NOT NULL AND date IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (nom, mois, jour_semaine) DO UPDATE SET
+        lignes = r.lignes + EXCLUDED.lignes,
+        jours_travail = r.jours_travail + EXCLUDED.jours_travail,
+        travail = r.travail + EXCLUDED.travail,
+        premiere_date = LEAST(r.premiere_date, EXCLUDED.premiere_date),
+        derniere_date = GREATEST(r.derniere_date, EXCLUDED.derniere_date)
+"""
+
+# table brute partitionnée par mois sur date ; les lignes sans date vont dans la partition par défaut.
+# Pas de clé primaire : sur une table partitionnée elle devrait contenir date, qui peut être NULL ;
+# l'index unique (nom, date) sert aux recherches et au dédoublonnage de insert_to_db
+TABLE_DDL = """
+    CREATE TABLE {table} (
+        id integer NOT NULL DEFAULT nextval('{table}_id_seq'),
+        nom varchar(100),
+        date date,
+        travail interval,
+        travail_cumule interval
+    ) PARTITION BY RANGE (date);
+    CREATE TABLE {table}_default PARTITION OF {table} DEFAULT;
+    CREATE UNIQUE INDEX {table}_nom_date_key ON {table} (nom, date);
+"""
+
+_ready = set()
+_ready_lock = threading.Lock()
+
+
+def ensure_unique_index(cursor, table='dbbi'):
+    # l'index unique sur (nom, date) permet de dédoublonner avec ON CONFLICT
+    cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {table}_nom_date_key ON {table} (nom, date)")
+
+
+def ensure_rollups(connection, table='dbbi'):
+    # créer les tables d'agrégats au premier usage et les remplir une fois à partir de la table brute ;
+    # ensuite elles ne sont plus mises à jour que par insert_with_rollups
+    with _ready_lock:
+        if table in _ready:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT to_regclass(%s)", (f"{table}_monthly",))
+            if cursor.fetchone()[0] is None:
+                try:
+                    # bloquer les insertions concurrentes pendant le remplissage initial
+                    cursor.execute(f"LOCK TABLE {table} IN SHARE MODE")
+                    cursor.execute(ROLLUP_DDL.format(table=table))
+                    for upsert in (DAILY_UPSERT, MONTHLY_UPSERT):
+                        cursor.execute(upsert.format(table=table, source=table, hours=HOURS))
+                except psycopg2.errors.DuplicateTable:
+                    # un autre processus les a créées entre-temps
+                    connection.rollback()
+        connection.commit()
+        _ready.add(table)
+
+
+def drop_rollups(connection, table):
+    with _ready_lock:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}_daily, {table}_monthly")
+        connection.commit()
+        _ready.discard(table)
+
+
+def insert_with_rollups(table, values, on_conflict=''):
+    # une seule instruction : insérer dans la table brute et reporter les lignes réellement
+    # insérées (RETURNING) dans les deux tables d'agrégats ; renvoie une ligne par insertion
+    return f"""
+        WITH inserted AS (
+            INSERT INTO {table} (Nom, Date, Travail, Travail_cumule)
+            VALUES {values}
+            {on_conflict}
+            RETURNING nom, date, travail
+        ), daily AS (
+            {DAILY_UPSERT.format(table=table, source='inserted', hours=HOURS)}
+        ), monthly AS (
+            {MONTHLY_UPSERT.format(table=table, source='inserted', hours=HOURS)}
+        )
+        SELECT 1 FROM inserted
+    """
+
+
+def high_water_marks(connection, table='dbbi'):
+    # dernière date déjà enregistrée pour chaque employé, lue dans l'agrégat mensuel (maintenu à chaque insertion)
+    ensure_rollups(connection, table)
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT nom, MAX(derniere_date) FROM {table}_monthly GROUP BY nom")
+        return dict(cursor.fetchall())
+
+
+def relation_kind(cursor, table):
+    # 'p' table partitionnée, 'r' table ordinaire, None si elle n'existe pas
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (table,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def month_start(value):
+    return datetime.date(value.year, value.month, 1)
+
+
+def next_month(month):
+    return datetime.date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(table, month):
+    return f"{table}_p{month:%Y%m}"
+
+
+def partition_months(cursor, table):
+    # mois des partitions attachées, d'après leur nom {table}_pAAAAMM
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s)
+    """, (table,))
+    prefix = f"{table}_p"
+    return {datetime.date(int(name[-6:-2]), int(name[-2:]), 1)
+            for name, in cursor.fetchall() if name.startswith(prefix) and name[len(prefix):].isdigit()}
+
+
+def create_partition(cursor, table, month):
+    # la partition est créée à part, reçoit les lignes du mois déjà tombées dans la partition par défaut,
+    # puis est attachée : ATTACH refuserait sinon de couvrir des lignes présentes dans la partition par défaut
+    name = partition_name(table, month)
+    start, end = month, next_month(month)
+    cursor.execute(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)")
+    cursor.execute(f"""
+        WITH moved AS (DELETE FROM {table}_default WHERE date >= %s AND date < %s RETURNING *)
+        INSERT INTO {name} SELECT * FROM moved
+    """, (start, end))
+    cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", (start, end))
+
+
+def ensure_partitions(connection, table, dates):
+    # créer avant une insertion les partitions mensuelles manquantes pour ces dates ; sans effet sur une
+    # table ordinaire (base non migrée, table de test)
+    months = {month_start(date) for date in dates if date is not None}
+    with connection.cursor() as cursor:
+        if not months or relation_kind(cursor, table) != 'p':
+            return
+        if months <= partition_months(cursor, table):
+            return
+        # un seul processus crée les partitions à la fois ; relire la liste une fois le verrou obtenu
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table,))
+        for month in sorted(months - partition_months(cursor, table)):
+            create_partition(cursor, table, month)
+    connection.commit()
+
+
+def migrate(connection, table='dbbi', keep_legacy=False):
+    # transformer une table ordinaire en table partitionnée par mois, ou la créer si elle n'existe pas ;
+    # tout se fait dans une transaction : en cas d'erreur la table d'origine reste intacte
+    legacy = f"{table}_legacy"
+    report = {'table': table, 'status': 'created', 'rows': 0, 'duplicates': 0, 'partitions': 0}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (table,))
+        kind = relation_kind(cursor, table)
+        if kind == 'p':
+            connection.rollback()
+            return {**report, 'status': 'already partitioned'}
+        if kind is not None:
+            # libérer le nom de la table et de ses index pour la nouvelle table ; la séquence des id est reprise
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+            cursor.execute(f"ALTER INDEX IF EXISTS {table}_nom_date_key RENAME TO {legacy}_nom_date_key")
+            cursor.execute(f"ALTER INDEX IF EXISTS {table}_pkey RENAME TO {legacy}_pkey")
+        cursor.execute(f"CREATE SEQUENCE IF NOT EXISTS {table}_id_seq")
+        cursor.execute(TABLE_DDL.format(table=table))
+        cursor.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+        if kind is not None:
+            cursor.execute(f"SELECT DISTINCT date_trunc('month', date)::date FROM {legacy} WHERE date IS NOT NULL")
+            months = sorted(month for month, in cursor.fetchall())
+            for month in months:
+                create_partition(cursor, table, month)
+            # les doublons (nom, date) éventuels sont écartés, la ligne la plus ancienne est gardée
+            cursor.execute(f"""
+                INSERT INTO {table} (id, nom, date, travail, travail_cumule)
+                SELECT id, nom, CAST(date AS date), CAST(travail AS interval), CAST(travail_cumule AS interval)
+                FROM {legacy} ORDER BY id
+                ON CONFLICT (nom, date) DO NOTHING
+            """)
+            copied = cursor.rowcount
+            cursor.execute(f"SELECT COUNT(*) FROM {legacy}")
+            report.update(status='migrated', rows=copied, duplicates=cursor.fetchone()[0] - copied,
+                          partitions=len(months))
+            if not keep_legacy:
+                cursor.execute(f"DROP TABLE {legacy}")
+    connection.commit()
+    # les agrégats ont pu compter des doublons : les reconstruire à partir de la nouvelle table
+    drop_rollups(connection, table)
+    ensure_rollups(connection, table)
+    return report
+
+
+def archive_partitions(connection, table, before):
+    # détacher les partitions des mois antérieurs à before : elles restent en base comme tables autonomes
+    # ({table}_pAAAAMM) mais ne sont plus lues ; leurs lignes sont retirées des agrégats
+    before = month_start(before)
+    with connection.cursor() as cursor:
+        if relation_kind(cursor, table) != 'p':
+            raise ValueError(f"{table} is not partitioned, run the migration first")
+        months = sorted(month for month in partition_months(cursor, table) if month < before)
+        for month in months:
+            cursor.execute(f"ALTER TABLE {table} DETACH PARTITION {partition_name(table, month)}")
+        if relation_kind(cursor, f"{table}_monthly") is not None:
+            cursor.execute(f"DELETE FROM {table}_daily WHERE date < %s", (before,))
+            cursor.execute(f"DELETE FROM {table}_monthly WHERE mois < %s", (before,))
+    connection.commit()
+    return [partition_name(table, month) for month in months]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gestion du schéma de la table de pointage")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = subparsers.add_parser('migrate', help="partitionner la table par mois (ou la créer)")
+    migrate_parser.add_argument('--table', default='dbbi')
+    migrate_parser.add_argument('--keep-legacy', action='store_true', help="garder l'ancienne table ({table}_legacy)")
+    archive_parser = subparsers.add_parser('archive', help="détacher les partitions antérieures à un mois")
+    archive_parser.add_argument('--table', default='dbbi')
+    archive_parser.add_argument('--before', required=True, help="premier mois conservé, AAAA-MM")
+    args = parser.parse_args(argv)
+
+    with db.connection() as connection:
+        if args.command == 'migrate':
+            print(migrate(connection, args.table, keep_legacy=args.keep_legacy))
+        else:
+            before = datetime.datetime.strptime(args.before, '%Y-%m').date()
+            detached = archive_partitions(connection, args.table, before)
+            print(f"{len(detached)} partitions détachées : {', '.join(detached)}")
+
+
+if __name__ == "__main__":
+    main()
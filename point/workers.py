@@ -0,0 +1,61 @@
+import threading
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal, pyqtSlot
+
+import instrument
+
+logger = instrument.get_logger('workers')
+
+
+class WorkerSignals(QObject):
+    # progress : (lignes traitées, total) ; un total de 0 signifie inconnu
+    progress = pyqtSignal(int, int)
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    finished = pyqtSignal()
+
+
+class Worker(QRunnable):
+    def __init__(self, fn, *args, **kwargs):
+        super(Worker, self).__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = WorkerSignals()
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    @pyqtSlot()
+    def run(self):
+        # la fonction reçoit de quoi signaler sa progression et vérifier l'annulation entre deux lots
+        try:
+            result = self.fn(*self.args, progress=self.signals.progress.emit,
+                             is_cancelled=self.is_cancelled, **self.kwargs)
+        except Exception as e:
+            logger.exception("Worker task %s failed", getattr(self.fn, '__name__', self.fn))
+            self.signals.error.emit(str(e))
+        else:
+            if not self.is_cancelled():
+                self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
+
+
+def start_worker(fn, *args, on_result=None, on_error=None, on_progress=None, on_finished=None, **kwargs):
+    # lancer fn sur le pool global de Qt ; les signaux sont reçus dans le thread de l'interface
+    worker = Worker(fn, *args, **kwargs)
+    if on_result is not None:
+        worker.signals.result.connect(on_result)
+    if on_error is not None:
+        worker.signals.error.connect(on_error)
+    if on_progress is not None:
+        worker.signals.progress.connect(on_progress)
+    if on_finished is not None:
+        worker.signals.finished.connect(on_finished)
+    QThreadPool.globalInstance().start(worker)
+    return worker